@@ -2,19 +2,28 @@ import os
 import sys
 import logging
 import asyncio
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Any
+from functools import lru_cache
+from operator import attrgetter
 from dotenv import load_dotenv
 from pytz import timezone, utc
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.base import JobLookupError
 
-from telegram import (
-    Update, InlineKeyboardButton, InlineKeyboardMarkup,
-    ReplyKeyboardRemove
-)
+try:
+    import uvloop
+except ImportError:  # Windows / локальная разработка без uvloop
+    uvloop = None
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler,
-    MessageHandler, filters, ContextTypes, ConversationHandler
+    MessageHandler, filters, ContextTypes, ConversationHandler,
+    AIORateLimiter, Defaults
 )
 
 # ====================== НАСТРОЙКИ ======================
@@ -30,18 +39,26 @@ WAITING_DELETE_STUDENT = 12
 
 def safe_getenv(key, default=None):
     value = os.getenv(key, default)
-    if value:
-        try:
-            return value.encode('utf-8').decode('utf-8')
-        except:
-            return ''.join(c for c in str(value) if ord(c) < 128)
-    return value
+    if not value or value.isascii():
+        return value
+    try:
+        # Нечитаемые байты окружения Python хранит как суррогаты, их utf-8 не закодирует
+        value.encode('utf-8')
+        return value
+    except UnicodeEncodeError:
+        return value.encode('ascii', 'ignore').decode('ascii')
 
 
 TOKEN = safe_getenv('TELEGRAM_BOT_TOKEN')
 TUTOR_ID = int(safe_getenv('TUTOR_ID', '0') or 0)
 TIMEZONE = safe_getenv('TIMEZONE', 'Europe/Moscow')
 
+# Вебхук: если WEBHOOK_URL задан, Telegram сам присылает обновления на этот адрес,
+# иначе бот работает через long polling
+WEBHOOK_URL = safe_getenv('WEBHOOK_URL')
+WEBHOOK_SECRET = safe_getenv('WEBHOOK_SECRET')
+PORT = int(safe_getenv('PORT', '8080') or 8080)
+
 # ====================== ЛОГИРОВАНИЕ ======================
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -53,10 +70,111 @@ logger = logging.getLogger(__name__)
 application = None
 scheduler = None
 
+# Сколько сообщений отправляем одновременно (лимит Telegram ~30 в секунду)
+SEND_CONCURRENCY = 20
+
+# Очередь уведомлений: создаётся в on_startup внутри event loop приложения
+notification_queue = None
+notification_task = None
+# Сигнал остановки: обработчик досылает текущую пачку и завершается
+notification_stop = None
+# Уведомления, пришедшие за это время, склеиваются в одно сообщение на чат
+NOTIFICATION_FLUSH_SECONDS = 3
+# Предел очереди уведомлений: при переполнении новые уведомления отбрасываются
+NOTIFICATION_QUEUE_SIZE = 1024
+# Максимальная длина сообщения Telegram
+MESSAGE_LIMIT = 4096
+# Разделитель между уведомлениями, склеенными в одно сообщение
+NOTIFICATION_SEPARATOR = "\n\n---\n\n"
+
 # ====================== ХРАНИЛИЩЕ ======================
+@dataclass(slots=True)
+class User:
+    id: int
+    telegram_id: int
+    username: str
+    full_name: str
+    role: str
+    created_at: str
+    lives: int
+    last_life_reset: str
+    timezone: str
+    # Разобранное время последнего сброса жизней (UTC)
+    last_life_reset_dt: datetime = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.last_life_reset_dt = datetime.fromisoformat(self.last_life_reset)
+
+
+@dataclass(slots=True)
+class Homework:
+    id: int
+    student_id: int
+    tutor_id: int
+    task_text: str
+    deadline: str
+    created_at: str
+    is_completed: bool = False
+    late_notified: bool = False
+    completed_at: str = None
+    # Разобранный дедлайн (UTC), чтобы не парсить строку при каждом проходе
+    deadline_dt: datetime = field(init=False, repr=False)
+    # Дедлайн как UTC timestamp: числа сравниваются быстрее дат и строк
+    deadline_ts: float = field(init=False, repr=False)
+    # Начало текста задания для списков/напоминаний и для уведомлений репетитору
+    task_preview: str = field(init=False, repr=False)
+    task_preview_long: str = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.deadline_dt = datetime.fromisoformat(self.deadline)
+        self.deadline_ts = self.deadline_dt.timestamp()
+        self.task_preview = self.task_text[:50]
+        self.task_preview_long = self.task_text[:100]
+
+
+@dataclass(slots=True)
+class Lesson:
+    id: int
+    student_id: int
+    tutor_id: int
+    topic: str
+    lesson_time: str
+    created_at: str
+    duration_minutes: int = 60
+    notify_student: bool = True
+    # Разобранное время начала (UTC) и оно же как timestamp для сортировки
+    lesson_time_dt: datetime = field(init=False, repr=False)
+    lesson_time_ts: float = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.lesson_time_dt = datetime.fromisoformat(self.lesson_time)
+        self.lesson_time_ts = self.lesson_time_dt.timestamp()
+
+
 users_db = {}
-homeworks_db = []
+# Кто считается репетитором: TUTOR_ID из окружения и пользователи с ролью tutor
+tutor_ids = {TUTOR_ID} if TUTOR_ID else set()
+# Ученики в порядке регистрации: telegram_id -> User (те же объекты, что в users_db)
+students_by_id = {}
+# ДЗ по id, как users_db: удаление по индексу ученика не требует прохода по всем ДЗ
+homeworks_db = {}
+# Индекс ДЗ по ученику: student_id -> список его ДЗ (те же объекты, что в homeworks_db)
+homeworks_by_student = {}
+# Число невыполненных и выполненных ДЗ у каждого ученика
+pending_count = Counter()
+completed_count = Counter()
+# Невыполненные ДЗ, отсортированные по дедлайну (timestamp):
+# граница между просроченными и активными находится бинарным поиском
+pending_homeworks = []
+by_deadline = attrgetter('deadline_ts')
+# Сколько выполненных ДЗ ученика держим в памяти; более старые удаляются,
+# а их количество остаётся в completed_count
+MAX_COMPLETED_HISTORY = 20
+# Занятия, отсортированные по времени начала (timestamp)
 lessons_db = []
+# Индекс занятий по ученику: student_id -> список его занятий, тоже по времени
+lessons_by_student = {}
+by_lesson_time = attrgetter('lesson_time_ts')
 next_id = 1
 
 # Настройки
@@ -66,8 +184,9 @@ settings = {
         'homework_reminders': True,
         'lesson_reminders': True,
         'late_homework_alerts': True,
-        'homework_times': [24, 12, 2],
-        'lesson_times': [24, 2]
+        # За сколько часов напоминать; множества: переключение и проверка за O(1)
+        'homework_times': {24, 12, 2},
+        'lesson_times': {24, 2}
     },
     'lives': {
         'enabled': True,
@@ -81,6 +200,105 @@ settings = {
 }
 
 
+# ====================== ТЕКСТЫ ======================
+# Неизменяемые тексты держим на уровне модуля, а не собираем в каждом вызове
+TUTOR_WELCOME_TEMPLATE = """
+👨‍🏫 Добро пожаловать, репетитор {name}!
+
+Ваш ID: {user_id}
+Таймзона: {timezone}
+Текущее время: {now}
+
+Используйте /menu для управления
+"""
+
+STUDENT_WELCOME_TEMPLATE = """
+👨‍🎓 Привет, {name}!
+
+Я бот-помощник репетитора HelperTutor.
+
+{lives_text}
+🕐 Текущее время: {now}
+
+Я помогу вам:
+• Следить за домашними заданиями
+• Отмечать выполненные работы
+• Не пропускать занятия
+• Получать напоминания
+"""
+
+TUTOR_HELP_TEXT = """
+📚 HelperTutor - Умный бот-помощник репетитора
+
+👨‍🏫 Команды репетитора:
+/start - Начать работу
+/menu - Панель управления
+/add_hw - Добавить ДЗ
+/add_lesson - Добавить занятие
+/list_hw - Список ДЗ
+/students - Список учеников
+/delete_student - Удалить ученика
+/settings - Настройки
+/stats - Статистика
+/reset_lives - Сбросить жизни всем
+/clear_all - Очистить все данные (осторожно!)
+/help - Эта справка
+
+📝 Управление через кнопки:
+• Добавление ДЗ и занятий
+• Просмотр статистики
+• Настройки уведомлений
+• Управление учениками
+
+❤️ Система жизней:
+• Настройка штрафов и наград
+• Авто-сброс по расписанию
+• Уведомления ученикам
+
+🕐 Умное время:
+• Поддержка всех таймзон
+• Автоматическая конвертация
+"""
+
+STUDENT_HELP_TEXT = """
+👨‍🎓 Команды ученика:
+/start - Начать работу
+/help - Эта справка
+
+📝 Управление через кнопки:
+• Отметка выполнения ДЗ
+• Просмотр своих ДЗ
+• Расписание занятий
+• Профиль ученика
+
+❤️ Система жизней:
+• Жизни отнимаются за просрочки
+• Начисляются за досрочное выполнение
+• Автоматический сброс
+
+🔔 Уведомления:
+• Напоминания о ДЗ
+• Уведомления о занятиях
+"""
+
+
+def hours_word(n):
+    """Склонение слова «час» для числа n"""
+    if n % 10 == 1 and n % 100 != 11:
+        return 'час'
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return 'часа'
+    return 'часов'
+
+
+# Напоминания ставятся за 1..24 часа, поэтому формы считаем заранее
+HOURS_WORD = {n: hours_word(n) for n in range(1, 25)}
+
+# Первые строки напоминаний для каждого смещения
+HW_REMINDER_HEADERS = {n: f"⏰ Напоминание: ДЗ через {n} {word}!\n" for n, word in HOURS_WORD.items()}
+LESSON_REMINDER_HEADERS = {n: f"👨‍🏫 Напоминание: занятие через {n} {word}!\n" for n, word in HOURS_WORD.items()}
+
+
 # ====================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ======================
 def get_next_id():
     global next_id
@@ -94,40 +312,55 @@ def get_user(telegram_id):
 
 def register_user(telegram_id, username, full_name, role='student'):
     if telegram_id not in users_db:
-        users_db[telegram_id] = {
-            'id': telegram_id,
-            'telegram_id': telegram_id,
-            'username': username or '',
-            'full_name': full_name,
-            'role': role,
-            'created_at': datetime.now().isoformat(),
-            'lives': settings['lives']['max_lives'],
-            'last_life_reset': datetime.now().isoformat(),
-            'timezone': settings['timezone']
-        }
+        now = datetime.now(utc).isoformat()
+        users_db[telegram_id] = User(
+            id=telegram_id,
+            telegram_id=telegram_id,
+            username=username or '',
+            full_name=full_name,
+            role=role,
+            created_at=now,
+            lives=settings['lives']['max_lives'],
+            last_life_reset=now,
+            timezone=settings['timezone']
+        )
+        if role == 'tutor':
+            tutor_ids.add(telegram_id)
+        elif role == 'student':
+            students_by_id[telegram_id] = users_db[telegram_id]
         return True
     return False
 
 
 def is_tutor(telegram_id):
-    user = get_user(telegram_id)
-    if user:
-        return user['role'] == 'tutor'
-    return telegram_id == TUTOR_ID
+    return telegram_id in tutor_ids
 
 
-def get_local_time(dt_str=None, user_tz=None):
-    try:
-        if dt_str is None:
-            dt = datetime.now(utc)
-        else:
-            dt = datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
+@lru_cache(maxsize=64)
+def get_tz(name):
+    """Объект таймзоны по имени; таймзон немного, поэтому кэшируем"""
+    return timezone(name)
+
+
+@lru_cache(maxsize=4096)
+def format_local_time(dt, tz_name):
+    """Форматирование конкретного момента в таймзоне; одни и те же дедлайны
+    показываются в списках многократно, поэтому кэшируем"""
+    if isinstance(dt, str):
+        dt = datetime.fromisoformat(dt)
+    return dt.astimezone(get_tz(tz_name)).strftime('%d.%m.%Y %H:%M')
+
 
-        tz = timezone(user_tz or settings['timezone'])
-        local_dt = dt.astimezone(tz)
-        return local_dt.strftime('%d.%m.%Y %H:%M')
+def get_local_time(dt=None, user_tz=None):
+    """Время в таймзоне пользователя; dt - datetime, ISO-строка или None (сейчас)"""
+    try:
+        tz_name = user_tz or settings['timezone']
+        if dt is None:
+            # "Сейчас" не кэшируем
+            return datetime.now(utc).astimezone(get_tz(tz_name)).strftime('%d.%m.%Y %H:%M')
+        return format_local_time(dt, tz_name)
     except Exception as e:
-        logger.error(f"Ошибка конвертации времени: {e}")
+        logger.error("Ошибка конвертации времени: %s", e)
         return datetime.now().strftime('%d.%m.%Y %H:%M')
 
 
@@ -135,7 +368,7 @@ def parse_datetime(dt_str, user_tz=None):
     try:
         dt = datetime.strptime(dt_str, '%d.%m.%Y %H:%M')
 
-        tz = timezone(user_tz or settings['timezone'])
+        tz = get_tz(user_tz or settings['timezone'])
         dt = tz.localize(dt)
 
         dt_utc = dt.astimezone(utc)
@@ -143,191 +376,490 @@ def parse_datetime(dt_str, user_tz=None):
     except ValueError:
         try:
             dt = datetime.strptime(dt_str, '%d.%m.%Y')
-            tz = timezone(user_tz or settings['timezone'])
+            tz = get_tz(user_tz or settings['timezone'])
             dt = tz.localize(dt.replace(hour=23, minute=59))
             dt_utc = dt.astimezone(utc)
             return dt_utc
         except Exception as e:
-            logger.error(f"Ошибка парсинга даты: {e}")
+            logger.error("Ошибка парсинга даты: %s", e)
             return None
 
 
 def get_students():
-    return [u for u in users_db.values() if u.get('role') == 'student']
+    """Живое представление учеников без копирования; только для чтения"""
+    return students_by_id.values()
 
 
-def get_homeworks_for_student(student_id):
-    return [h for h in homeworks_db if h['student_id'] == student_id and not h.get('is_completed')]
+def reset_user_lives(user, now_utc):
+    user.lives = settings['lives']['max_lives']
+    user.last_life_reset = now_utc.isoformat()
+    user.last_life_reset_dt = now_utc
 
 
-def get_active_homeworks():
-    now_utc = datetime.now(utc).isoformat()
-    return [h for h in homeworks_db if h['deadline'] > now_utc and not h.get('is_completed')]
+def format_active_homeworks(active):
+    """Текст списка активных ДЗ (первые 10)"""
+    if not active:
+        return "📭 Нет активных ДЗ."
+
+    lines = ["📚 Активные ДЗ:\n\n"]
+    # Шапка ученика на время отрисовки: у одного ученика обычно несколько ДЗ
+    headers = {}
+    for hw in active[:10]:
+        header = headers.get(hw.student_id)
+        if header is None:
+            student = get_user(hw.student_id)
+            if student:
+                header = (f"👤 {student.full_name} ({student.lives}❤️)\n", student.timezone)
+            else:
+                header = ("👤 ???\n", settings['timezone'])
+            headers[hw.student_id] = header
+        student_line, student_tz = header
+        lines.append(
+            f"{student_line}"
+            f"📝 {hw.task_preview}...\n"
+            f"📅 {get_local_time(hw.deadline_dt, student_tz)}\n"
+            f"⏰ Таймзона: {student_tz}\n\n"
+        )
+    return "".join(lines)
+
 
+def format_students(students):
+    """Текст списка учеников"""
+    if not students:
+        return "👥 Нет учеников."
+
+    max_lives = settings['lives']['max_lives']
+    lines = [f"👥 Ученики ({len(students)}):\n\n"]
+    for s in students:
+        active_hws = pending_count[s.telegram_id]
+        completed_hws = completed_count[s.telegram_id]
+        lines.append(
+            f"• {s.full_name}\n"
+            f"  ❤️ Жизни: {s.lives}/{max_lives}\n"
+            f"  📊 ДЗ: {active_hws} активных, {completed_hws} выполнено\n"
+            f"  🕐 Таймзона: {s.timezone}\n\n"
+        )
+    return "".join(lines)
 
-def get_late_homeworks():
+
+def count_lives(students):
+    """Распределение учеников по жизням за один проход"""
+    max_lives = settings['lives']['max_lives']
+    full = half = zero = 0
+    for s in students:
+        lives = s.lives
+        full += lives == max_lives
+        half += 0 < lives < max_lives
+        zero += lives == 0
+    return {'full': full, 'half': half, 'zero': zero}
+
+
+def format_stats():
+    """Текст статистики для репетитора"""
     now_utc = datetime.now(utc)
-    now_utc_str = now_utc.isoformat()
-    late_hws = []
-    for h in homeworks_db:
-        try:
-            deadline = datetime.fromisoformat(h['deadline'].replace('Z', '+00:00'))
-            if (deadline < now_utc and
-                not h.get('is_completed') and
-                not h.get('late_notified')):
-                late_hws.append(h)
-        except Exception as e:
-            logger.error(f"Ошибка проверки просрочки ДЗ {h.get('id')}: {e}")
-    return late_hws
+    students = get_students()
+    active_hws = count_active_homeworks(now_utc)
+    upcoming_lessons = get_upcoming_lessons(now_utc)
+    late_hws = get_late_homeworks(now_utc)
+
+    lives_stats = count_lives(students)
+
+    parts = [
+        "📊 Статистика\n\n"
+        f"👥 Учеников: {len(students)}\n"
+        f"📚 Активных ДЗ: {active_hws}\n"
+        f"⚠️ Просроченных: {len(late_hws)}\n"
+        f"🗓 Занятий: {len(upcoming_lessons)}\n\n"
+    ]
+
+    if settings['lives']['enabled']:
+        parts.append(
+            "❤️ Жизни:\n"
+            f"• Полные: {lives_stats['full']}\n"
+            f"• Частичные: {lives_stats['half']}\n"
+            f"• Нет: {lives_stats['zero']}\n\n"
+        )
+
+    parts.append(f"🕐 Таймзона: {settings['timezone']}")
+    return "".join(parts)
+
+
+def add_homework(hw):
+    homeworks_db[hw.id] = hw
+    homeworks_by_student.setdefault(hw.student_id, []).append(hw)
+    if not hw.is_completed:
+        pending_count[hw.student_id] += 1
+        insort(pending_homeworks, hw, key=by_deadline)
+
+
+def mark_homework_completed(hw, completed_at):
+    """Отмечает ДЗ выполненным и удаляет самое старое выполненное сверх MAX_COMPLETED_HISTORY"""
+    hw.is_completed = True
+    hw.completed_at = completed_at
+    pending_count[hw.student_id] -= 1
+    completed_count[hw.student_id] += 1
+    # Среди ДЗ с тем же дедлайном ищем именно это
+    i = bisect_left(pending_homeworks, hw.deadline_ts, key=by_deadline)
+    while i < len(pending_homeworks) and pending_homeworks[i] is not hw:
+        i += 1
+    if i < len(pending_homeworks):
+        del pending_homeworks[i]
+    remove_reminder_jobs('hw', hw.id)
+
+    completed = [h for h in homeworks_by_student[hw.student_id] if h.is_completed]
+    if len(completed) > MAX_COMPLETED_HISTORY:
+        oldest = min(completed, key=lambda h: h.completed_at)
+        homeworks_by_student[hw.student_id].remove(oldest)
+        del homeworks_db[oldest.id]
+        remove_reminder_jobs('hw', oldest.id)
+
+
+def remove_student_homeworks(student_id):
+    """Удаляет все ДЗ ученика из хранилища и индексов"""
+    for hw in homeworks_by_student.pop(student_id, ()):
+        del homeworks_db[hw.id]
+        remove_reminder_jobs('hw', hw.id)
+    pending_homeworks[:] = [h for h in pending_homeworks if h.student_id != student_id]
+    pending_count.pop(student_id, None)
+    completed_count.pop(student_id, None)
+
+
+def get_all_homeworks_for_student(student_id):
+    return homeworks_by_student.get(student_id, [])
+
+
+def get_homeworks_for_student(student_id):
+    return [h for h in get_all_homeworks_for_student(student_id) if not h.is_completed]
+
+
+def add_lesson(lesson):
+    insort(lessons_db, lesson, key=by_lesson_time)
+    insort(lessons_by_student.setdefault(lesson.student_id, []), lesson, key=by_lesson_time)
+
+
+def remove_student_lessons(student_id):
+    """Удаляет все занятия ученика из хранилища и индекса"""
+    lessons = lessons_by_student.pop(student_id, None)
+    if lessons:
+        lessons_db[:] = [l for l in lessons_db if l.student_id != student_id]
+        for lesson in lessons:
+            remove_reminder_jobs('lesson', lesson.id)
+
+
+# Выборки принимают общее "сейчас" (UTC), чтобы вызывающий код, которому нужно
+# несколько выборок подряд, получал их на один момент времени
+def get_active_homeworks(now_utc=None):
+    now_ts = (now_utc or datetime.now(utc)).timestamp()
+    return pending_homeworks[bisect_right(pending_homeworks, now_ts, key=by_deadline):]
 
 
-def get_upcoming_lessons():
-    now_utc = datetime.now(utc).isoformat()
-    return [l for l in lessons_db if l['lesson_time'] > now_utc]
+def count_active_homeworks(now_utc=None):
+    """Число активных ДЗ без копирования среза"""
+    now_ts = (now_utc or datetime.now(utc)).timestamp()
+    return len(pending_homeworks) - bisect_right(pending_homeworks, now_ts, key=by_deadline)
+
+
+def get_late_homeworks(now_utc=None):
+    now_ts = (now_utc or datetime.now(utc)).timestamp()
+    late_hws = pending_homeworks[:bisect_left(pending_homeworks, now_ts, key=by_deadline)]
+    return [h for h in late_hws if not h.late_notified]
+
+
+def get_upcoming_lessons(now_utc=None, student_id=None):
+    """Будущие занятия по времени; при student_id - только занятия этого ученика"""
+    now_ts = (now_utc or datetime.now(utc)).timestamp()
+    lessons = lessons_db if student_id is None else lessons_by_student.get(student_id, [])
+    return lessons[bisect_right(lessons, now_ts, key=by_lesson_time):]
 
 
 async def update_lives(student_id, delta, reason=""):
     student = get_user(student_id)
-    if student and settings['lives']['enabled']:
-        current_lives = student.get('lives', settings['lives']['max_lives'])
-        new_lives = max(0, min(current_lives + delta, settings['lives']['max_lives']))
-        student['lives'] = new_lives
-
-        if delta != 0 and settings['lives']['show_to_student']:
-            try:
-                await application.bot.send_message(
-                    chat_id=student_id,
-                    text=f"{'❤️' if delta > 0 else '💔'} {reason}\nОсталось жизней: {new_lives}/{settings['lives']['max_lives']}"
-                )
-            except Exception as e:
-                logger.error(f"Ошибка отправки уведомления о жизнях: {e}")
+    lives_settings = settings['lives']
+    if student and lives_settings['enabled']:
+        max_lives = lives_settings['max_lives']
+        current_lives = student.lives
+        new_lives = max(0, min(current_lives + delta, max_lives))
+        student.lives = new_lives
+
+        if delta != 0 and lives_settings['show_to_student']:
+            queue_notification(
+                student_id,
+                f"{'❤️' if delta > 0 else '💔'} {reason}\nОсталось жизней: {new_lives}/{max_lives}"
+            )
 
         return new_lives
     return None
 
 
-def check_and_reset_lives():
+async def check_and_reset_lives():
+    # Корутина, чтобы планировщик выполнял её в цикле событий, а не в потоке:
+    # очередь уведомлений не потокобезопасна
     now = datetime.now(utc)
-    for user in users_db.values():
-        if user.get('role') == 'student':
-            last_reset_str = user.get('last_life_reset')
-            if last_reset_str:
-                try:
-                    last_reset = datetime.fromisoformat(last_reset_str.replace('Z', '+00:00'))
-                    days_passed = (now - last_reset).days
-                    if days_passed >= settings['lives']['auto_reset_days']:
-                        user['lives'] = settings['lives']['max_lives']
-                        user['last_life_reset'] = now.isoformat()
-
-                        try:
-                            asyncio.create_task(
-                                application.bot.send_message(
-                                    chat_id=user['telegram_id'],
-                                    text=f"🎉 Жизни сброшены! Теперь у вас {settings['lives']['max_lives']}❤️"
-                                )
-                            )
-                        except Exception as e:
-                            logger.error(f"Ошибка отправки уведомления о сбросе: {e}")
-                except Exception as e:
-                    logger.error(f"Ошибка обработки сброса жизней: {e}")
+    # Сброс нужен всем, чей последний сброс был раньше этого момента
+    reset_before = now - timedelta(days=settings['lives']['auto_reset_days'])
+    reset_text = f"🎉 Жизни сброшены! Теперь у вас {settings['lives']['max_lives']}❤️"
+    for user in students_by_id.values():
+        if user.last_life_reset_dt <= reset_before:
+            reset_user_lives(user, now)
+            queue_notification(user.telegram_id, reset_text, silent=True)
+
+
+def message_unchanged(message, text, reply_markup=None):
+    """Правку, которая ничего не меняет, Telegram всё равно отклонит - её не отправляем"""
+    # Telegram хранит текст сообщения без пробелов и переводов строк по краям
+    return message is not None and message.text == text.strip() and message.reply_markup == reply_markup
+
+
+def is_not_modified(error):
+    """Telegram отклонил правку, потому что сообщение уже такое: это не ошибка"""
+    return isinstance(error, BadRequest) and 'not modified' in error.message
+
+
+async def edit_or_reply(update, text, reply_markup=None):
+    """Редактирует сообщение с кнопками, а для команды отвечает новым сообщением"""
+    if update.callback_query:
+        if message_unchanged(update.callback_query.message, text, reply_markup):
+            return
+        try:
+            await update.callback_query.edit_message_text(text, reply_markup=reply_markup)
+        except Exception as e:
+            if is_not_modified(e):
+                return
+            logger.error("Ошибка при редактировании сообщения: %s", e)
+            await update.callback_query.message.reply_text(text, reply_markup=reply_markup)
+    else:
+        await update.message.reply_text(text, reply_markup=reply_markup)
+
+
+async def answer_and_edit(query, text, reply_markup=None):
+    """Отвечает на нажатие и редактирует сообщение параллельно, а не по очереди"""
+    if message_unchanged(query.message, text, reply_markup):
+        await query.answer()
+        return
+    answered, edited = await asyncio.gather(
+        query.answer(), query.edit_message_text(text, reply_markup=reply_markup), return_exceptions=True
+    )
+    if isinstance(answered, Exception):
+        logger.error("Ошибка ответа на нажатие кнопки: %s", answered)
+    if isinstance(edited, Exception) and not is_not_modified(edited):
+        logger.error("Ошибка при редактировании сообщения: %s", edited)
+        await query.message.reply_text(text, reply_markup=reply_markup)
+
+
+async def pick_student(update, prompt, empty_text, callback_prefix, button_text):
+    """Показывает список учеников для выбора. Возвращает False, если учеников нет"""
+    students = get_students()
+    if not students:
+        await edit_or_reply(update, empty_text, TUTOR_MAIN_KEYBOARD)
+        return False
+
+    keyboard = [[InlineKeyboardButton(button_text(s), callback_data=f"{callback_prefix}:{s.telegram_id}")]
+                for s in students]
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+
+    await edit_or_reply(update, prompt, InlineKeyboardMarkup(keyboard))
+    return True
 
 
 # ====================== НАПОМИНАНИЯ ======================
+def homework_reminders(hw, now_utc, hw_times):
+    """Напоминания по ДЗ: id задачи -> (время, аргументы); hw_times по возрастанию"""
+    reminders = {}
+    deadline = hw.deadline_dt
+    # Даже самое позднее напоминание уже прошло
+    if deadline - timedelta(hours=hw_times[0]) <= now_utc:
+        return reminders
+
+    student = get_user(hw.student_id)
+
+    if not student:
+        return reminders
+
+    # Текст после заголовка одинаков для всех смещений
+    body = f"📝 {hw.task_preview}...\n📅 Дедлайн: {get_local_time(hw.deadline_dt, student.timezone)}"
+
+    # Смещения по возрастанию: время напоминаний идёт от позднего к раннему,
+    # поэтому на первом прошедшем можно остановиться
+    for hours_before in hw_times:
+        reminder_time = deadline - timedelta(hours=hours_before)
+        if reminder_time <= now_utc:
+            break
+        header = (HW_REMINDER_HEADERS.get(hours_before)
+                  or f"⏰ Напоминание: ДЗ через {hours_before} {hours_word(hours_before)}!\n")
+        reminders[f"hw_{hours_before}h_{hw.id}"] = (reminder_time, [student.telegram_id, header + body])
+    return reminders
+
+
+def lesson_reminders(lesson, now_utc, lesson_times):
+    """Напоминания о занятии: id задачи -> (время, аргументы); lesson_times по возрастанию"""
+    reminders = {}
+    lesson_time = lesson.lesson_time_dt
+    if lesson_time - timedelta(hours=lesson_times[0]) <= now_utc:
+        return reminders
+
+    student = get_user(lesson.student_id)
+
+    if not student or not lesson.notify_student:
+        return reminders
+
+    body = f"📌 Тема: {lesson.topic}\n🕐 Начало: {get_local_time(lesson.lesson_time_dt, student.timezone)}"
+
+    for hours_before in lesson_times:
+        reminder_time = lesson_time - timedelta(hours=hours_before)
+        if reminder_time <= now_utc:
+            break
+        header = (LESSON_REMINDER_HEADERS.get(hours_before)
+                  or f"👨‍🏫 Напоминание: занятие через {hours_before} {hours_word(hours_before)}!\n")
+        reminders[f"lesson_{hours_before}h_{lesson.id}"] = (reminder_time, [student.telegram_id, header + body])
+    return reminders
+
+
+def add_reminder_jobs(reminders):
+    """Ставит напоминания одного ДЗ или занятия, не трогая остальные задачи"""
+    if not scheduler:
+        return
+    for job_id, (run_date, args) in reminders.items():
+        scheduler.add_job(send_reminder, 'date', run_date=run_date, args=args, id=job_id,
+                          replace_existing=True)
+
+
+def remove_reminder_jobs(kind, item_id):
+    """Снимает напоминания удалённого или выполненного ДЗ/занятия (kind - 'hw' или 'lesson')"""
+    if not scheduler:
+        return
+    # Задачи могли быть поставлены при других настройках, поэтому перебираем все смещения
+    times = settings['notifications']['homework_times' if kind == 'hw' else 'lesson_times']
+    for hours_before in times.union(NOTIFICATION_TIME_OPTIONS):
+        try:
+            scheduler.remove_job(f"{kind}_{hours_before}h_{item_id}")
+        except JobLookupError:
+            pass
+
+
+def schedule_homework_reminders(hw):
+    """Напоминания для нового ДЗ"""
+    notifications = settings['notifications']
+    hw_times = sorted(notifications['homework_times'])
+    if not notifications['homework_reminders'] or not hw_times:
+        return
+    try:
+        add_reminder_jobs(homework_reminders(hw, datetime.now(utc), hw_times))
+    except Exception as e:
+        logger.error("Ошибка планирования напоминания ДЗ: %s", e)
+
+
+def schedule_lesson_reminders(lesson):
+    """Напоминания для нового занятия"""
+    notifications = settings['notifications']
+    lesson_times = sorted(notifications['lesson_times'])
+    if not notifications['lesson_reminders'] or not lesson_times:
+        return
+    try:
+        add_reminder_jobs(lesson_reminders(lesson, datetime.now(utc), lesson_times))
+    except Exception as e:
+        logger.error("Ошибка планирования напоминания занятия: %s", e)
+
+
 def schedule_reminders():
+    """Полная сверка напоминаний: при запуске и после смены настроек"""
     if not scheduler:
         return
 
-    scheduler.remove_all_jobs()
     now_utc = datetime.now(utc)
 
-    scheduler.add_job(check_late_homeworks, 'interval', hours=1, id='check_late_homeworks')
-    scheduler.add_job(check_and_reset_lives, 'interval', hours=24, id='reset_lives_check')
+    # Собираем желаемый набор напоминаний: id задачи -> (время, аргументы)
+    desired = {}
+
+    notifications = settings['notifications']
+    hw_times = sorted(notifications['homework_times'])
+    lesson_times = sorted(notifications['lesson_times'])
 
-    if settings['notifications']['homework_reminders']:
-        for hw in get_active_homeworks():
+    if notifications['homework_reminders'] and hw_times:
+        for hw in get_active_homeworks(now_utc):
             try:
-                deadline = datetime.fromisoformat(hw['deadline'].replace('Z', '+00:00'))
-                student = get_user(hw['student_id'])
-
-                if not student:
-                    continue
-
-                for hours_before in settings['notifications']['homework_times']:
-                    reminder_time = deadline - timedelta(hours=hours_before)
-                    if reminder_time > now_utc:
-                        scheduler.add_job(
-                            send_reminder,
-                            'date',
-                            run_date=reminder_time,
-                            args=[student['telegram_id'],
-                                  f"⏰ Напоминание: ДЗ через {hours_before} {'час' if hours_before == 1 else 'часа' if 2 <= hours_before <= 4 else 'часов'}!\n"
-                                  f"📝 {hw['task_text'][:50]}...\n"
-                                  f"📅 Дедлайн: {get_local_time(hw['deadline'], student.get('timezone'))}"],
-                            id=f"hw_{hours_before}h_{hw['id']}"
-                        )
+                desired.update(homework_reminders(hw, now_utc, hw_times))
             except Exception as e:
-                logger.error(f"Ошибка планирования напоминания ДЗ: {e}")
+                logger.error("Ошибка планирования напоминания ДЗ: %s", e)
 
-    if settings['notifications']['lesson_reminders']:
-        for lesson in get_upcoming_lessons():
+    if notifications['lesson_reminders'] and lesson_times:
+        for lesson in get_upcoming_lessons(now_utc):
             try:
-                lesson_time = datetime.fromisoformat(lesson['lesson_time'].replace('Z', '+00:00'))
-                student = get_user(lesson['student_id'])
-
-                if not student or not lesson.get('notify_student', True):
-                    continue
-
-                for hours_before in settings['notifications']['lesson_times']:
-                    reminder_time = lesson_time - timedelta(hours=hours_before)
-                    if reminder_time > now_utc:
-                        scheduler.add_job(
-                            send_reminder,
-                            'date',
-                            run_date=reminder_time,
-                            args=[student['telegram_id'],
-                                  f"👨‍🏫 Напоминание: занятие через {hours_before} {'час' if hours_before == 1 else 'часа' if 2 <= hours_before <= 4 else 'часов'}!\n"
-                                  f"📌 Тема: {lesson.get('topic', 'Без темы')}\n"
-                                  f"🕐 Начало: {get_local_time(lesson['lesson_time'], student.get('timezone'))}"],
-                            id=f"lesson_{hours_before}h_{lesson['id']}"
-                        )
+                desired.update(lesson_reminders(lesson, now_utc, lesson_times))
             except Exception as e:
-                logger.error(f"Ошибка планирования напоминания занятия: {e}")
+                logger.error("Ошибка планирования напоминания занятия: %s", e)
+
+    existing = {job.id: job for job in scheduler.get_jobs()}
+
+    if 'check_late_homeworks' not in existing:
+        scheduler.add_job(check_late_homeworks, 'interval', hours=1, id='check_late_homeworks')
+    if 'reset_lives_check' not in existing:
+        scheduler.add_job(check_and_reset_lives, 'interval', hours=24, id='reset_lives_check')
+
+    # Меняем только то, что изменилось, а не пересоздаём все задачи
+    for job_id, job in existing.items():
+        if job_id not in desired and job_id not in ('check_late_homeworks', 'reset_lives_check'):
+            job.remove()
+
+    for job_id, (run_date, args) in desired.items():
+        job = existing.get(job_id)
+        if job is None:
+            scheduler.add_job(send_reminder, 'date', run_date=run_date, args=args, id=job_id)
+            continue
+        if job.next_run_time != run_date:
+            job.reschedule('date', run_date=run_date)
+        if list(job.args) != args:
+            job.modify(args=args)
+
+
+async def gather_limited(coros, limit=SEND_CONCURRENCY):
+    """Запускает корутины параллельно, но не больше limit одновременно"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros), return_exceptions=True)
 
 
 async def check_late_homeworks():
-    late_hws = get_late_homeworks()
+    # Уведомления только ставятся в очередь, ждать здесь нечего - параллелить незачем
+    for hw in get_late_homeworks():
+        await notify_late_homework(hw)
 
-    for hw in late_hws:
-        try:
-            student = get_user(hw['student_id'])
-            tutor = get_user(hw['tutor_id'])
 
-            if not student or not tutor:
-                continue
+async def notify_late_homework(hw):
+    try:
+        student = get_user(hw.student_id)
+        tutor = get_user(hw.tutor_id)
 
-            hw['late_notified'] = True
+        if not student or not tutor:
+            return
 
-            if settings['notifications']['late_homework_alerts']:
-                await application.bot.send_message(
-                    chat_id=tutor['telegram_id'],
-                    text=f"⚠️ ПРОСРОЧКА ДЗ!\n\n"
-                         f"👤 Ученик: {student['full_name']}\n"
-                         f"📝 {hw['task_text'][:100]}...\n"
-                         f"📅 Был дедлайн: {get_local_time(hw['deadline'], student.get('timezone'))}"
-                )
+        hw.late_notified = True
 
-            if settings['lives']['enabled']:
-                penalty = settings['lives']['penalty_late']
-                new_lives = await update_lives(student['telegram_id'], -penalty, f"Снято {penalty}❤️ за просрочку ДЗ")
+        if settings['notifications']['late_homework_alerts']:
+            queue_notification(
+                tutor.telegram_id,
+                f"⚠️ ПРОСРОЧКА ДЗ!\n\n"
+                f"👤 Ученик: {student.full_name}\n"
+                f"📝 {hw.task_preview_long}...\n"
+                f"📅 Был дедлайн: {get_local_time(hw.deadline_dt, student.timezone)}"
+            )
 
-                await application.bot.send_message(
-                    chat_id=tutor['telegram_id'],
-                    text=f"👤 {student['full_name']} потерял {penalty}❤️ за просрочку ДЗ\n"
-                         f"Осталось жизней: {new_lives}/{settings['lives']['max_lives']}"
-                )
+        lives_settings = settings['lives']
+        if lives_settings['enabled']:
+            penalty = lives_settings['penalty_late']
+            new_lives = await update_lives(student.telegram_id, -penalty, f"Снято {penalty}❤️ за просрочку ДЗ")
 
-        except Exception as e:
-            logger.error(f"Ошибка обработки просроченного ДЗ: {e}")
+            queue_notification(
+                tutor.telegram_id,
+                f"👤 {student.full_name} потерял {penalty}❤️ за просрочку ДЗ\n"
+                f"Осталось жизней: {new_lives}/{lives_settings['max_lives']}"
+            )
+
+    except Exception as e:
+        logger.error("Ошибка обработки просроченного ДЗ: %s", e)
 
 
 async def send_reminder(chat_id, message):
@@ -335,13 +867,113 @@ async def send_reminder(chat_id, message):
         if application:
             await application.bot.send_message(chat_id=chat_id, text=message)
     except Exception as e:
-        logger.error(f"Ошибка отправки напоминания: {e}")
+        logger.error("Ошибка отправки напоминания: %s", e)
+
+
+# ====================== ОЧЕРЕДЬ УВЕДОМЛЕНИЙ ======================
+def split_messages(texts, limit=MESSAGE_LIMIT, separator=NOTIFICATION_SEPARATOR):
+    """Склеивает тексты в сообщения не длиннее limit символов"""
+    messages = []
+    current = ""
+    for text in texts:
+        if current and len(current) + len(separator) + len(text) > limit:
+            messages.append(current)
+            current = ""
+        current = f"{current}{separator}{text}" if current else text
+    if current:
+        messages.append(current)
+    return messages
+
+
+async def send_notification_batch(batch):
+    """Отправляет накопленные уведомления: по одному сообщению на чат.
+    Сообщение приходит без звука, только если беззвучными были все его части"""
+    by_chat = {}
+    silent_chats = {}
+    for chat_id, text, silent in batch:
+        by_chat.setdefault(chat_id, []).append(text)
+        silent_chats[chat_id] = silent_chats.get(chat_id, True) and silent
+
+    await gather_limited(
+        send_notification(chat_id, message, silent_chats[chat_id])
+        for chat_id, texts in by_chat.items()
+        for message in split_messages(texts)
+    )
+
+
+async def send_notification(chat_id, text, silent=False):
+    try:
+        await application.bot.send_message(chat_id=chat_id, text=text, disable_notification=silent)
+    except Exception as e:
+        logger.error("Ошибка отправки уведомления: %s", e)
+
+
+def queue_notification(chat_id, text, silent=False):
+    """Ставит уведомление в очередь; если очередь не запущена, отправляет сразу в фоне.
+    silent=True - для массовых рассылок, которые не должны будить учеников звуком"""
+    if notification_task is None:
+        application.create_task(send_notification(chat_id, text, silent))
+        return
+    try:
+        notification_queue.put_nowait((chat_id, text, silent))
+    except asyncio.QueueFull:
+        logger.warning("Очередь уведомлений переполнена, уведомление для %s отброшено", chat_id)
+
+
+async def notification_worker():
+    """Собирает уведомления за NOTIFICATION_FLUSH_SECONDS и отправляет их пачкой"""
+    while not notification_stop.is_set():
+        item = await notification_queue.get()
+        if item is None:  # разбудили для остановки
+            break
+        batch = [item]
+        # При остановке бота не ждём конца окна, а сразу досылаем накопленное
+        try:
+            await asyncio.wait_for(notification_stop.wait(), NOTIFICATION_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        while not notification_queue.empty():
+            item = notification_queue.get_nowait()
+            if item is not None:
+                batch.append(item)
+        await send_notification_batch(batch)
+
+
+def start_notification_worker():
+    global notification_queue, notification_task, notification_stop
+    notification_queue = asyncio.Queue(maxsize=NOTIFICATION_QUEUE_SIZE)
+    notification_stop = asyncio.Event()
+    notification_task = asyncio.create_task(notification_worker())
+
+
+async def stop_notification_worker():
+    """Останавливает обработчик, не прерывая отправку уже забранной пачки"""
+    global notification_task
+    if notification_task is None:
+        return
+    task, notification_task = notification_task, None
+    notification_stop.set()
+    try:
+        # Будим обработчик, если он ждёт пустую очередь; полная очередь разбудит его сама
+        notification_queue.put_nowait(None)
+    except asyncio.QueueFull:
+        pass
+    await task
+
+    # То, что обработчик не успел забрать из очереди, отправляем сразу
+    batch = []
+    while not notification_queue.empty():
+        item = notification_queue.get_nowait()
+        if item is not None:
+            batch.append(item)
+    if batch:
+        await send_notification_batch(batch)
 
 
 # ====================== ОБРАБОТЧИК ОШИБОК ======================
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ошибок"""
-    logger.error(f"Ошибка: {context.error}", exc_info=context.error)
+    logger.error("Ошибка: %s", context.error, exc_info=context.error)
 
     try:
         if update and update.effective_message:
@@ -359,40 +991,26 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Очищаем контекст пользователя
     context.user_data.clear()
 
-    if is_tutor(user_id):
-        role = 'tutor'
-        welcome_text = f"""
-👨‍🏫 Добро пожаловать, репетитор {user.full_name}!
-
-Ваш ID: {user.id}
-Таймзона: {settings['timezone']}
-Текущее время: {get_local_time()}
-
-Используйте /menu для управления
-"""
-        reply_markup = get_tutor_main_keyboard()
+    # Одна выборка записи пользователя на весь обработчик
+    db_user = get_user(user_id)
+    if db_user:
+        role = db_user.role
     else:
-        role = 'student'
-        student = get_user(user_id)
-        lives_text = f"❤️ Ваши жизни: {student.get('lives', settings['lives']['max_lives'])}/{settings['lives']['max_lives']}" if student and settings['lives']['enabled'] else ""
-
-        welcome_text = f"""
-👨‍🎓 Привет, {user.full_name}!
-
-Я бот-помощник репетитора HelperTutor.
+        role = 'tutor' if user_id == TUTOR_ID else 'student'
 
-{lives_text}
-🕐 Текущее время: {get_local_time()}
+    if role == 'tutor':
+        welcome_text = TUTOR_WELCOME_TEMPLATE.format(
+            name=user.full_name, user_id=user.id, timezone=settings['timezone'], now=get_local_time()
+        )
+        reply_markup = TUTOR_MAIN_KEYBOARD
+    else:
+        lives_text = f"❤️ Ваши жизни: {db_user.lives}/{settings['lives']['max_lives']}" if db_user and settings['lives']['enabled'] else ""
 
-Я помогу вам:
-• Следить за домашними заданиями
-• Отмечать выполненные работы
-• Не пропускать занятия
-• Получать напоминания
-"""
-        reply_markup = get_student_main_keyboard()
+        welcome_text = STUDENT_WELCOME_TEMPLATE.format(name=user.full_name, lives_text=lives_text, now=get_local_time())
+        reply_markup = STUDENT_MAIN_KEYBOARD
 
-    register_user(user_id, user.username, user.full_name, role)
+    if not db_user:
+        register_user(user_id, user.username, user.full_name, role)
     await update.message.reply_text(welcome_text, reply_markup=reply_markup)
 
 
@@ -405,14 +1023,15 @@ async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Очищаем контекст пользователя
     context.user_data.clear()
 
+    now_utc = datetime.now(utc)
     await update.message.reply_text(
         f"📊 Панель управления репетитора\n\n"
         f"🕐 Таймзона: {settings['timezone']}\n"
         f"⏰ Текущее время: {get_local_time()}\n\n"
         f"👥 Учеников: {len(get_students())}\n"
-        f"📚 Активных ДЗ: {len(get_active_homeworks())}\n"
-        f"🗓 Занятий: {len(get_upcoming_lessons())}",
-        reply_markup=get_tutor_main_keyboard()
+        f"📚 Активных ДЗ: {count_active_homeworks(now_utc)}\n"
+        f"🗓 Занятий: {len(get_upcoming_lessons(now_utc))}",
+        reply_markup=TUTOR_MAIN_KEYBOARD
     )
 
 
@@ -447,22 +1066,8 @@ async def list_hw_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Очищаем контекст
     context.user_data.clear()
 
-    # Вызываем напрямую логику списка ДЗ
-    active = get_active_homeworks()
-
-    if not active:
-        text = "📭 Нет активных ДЗ."
-    else:
-        text = "📚 Активные ДЗ:\n\n"
-        for hw in active[:10]:
-            student = get_user(hw['student_id'])
-            student_tz = student.get('timezone', settings['timezone']) if student else settings['timezone']
-            text += f"👤 {student['full_name'] if student else '???'} ({student.get('lives', 0)}❤️)\n"
-            text += f"📝 {hw['task_text'][:50]}...\n"
-            text += f"📅 {get_local_time(hw['deadline'], student_tz)}\n"
-            text += f"⏰ Таймзона: {student_tz}\n\n"
-
-    await update.message.reply_text(text, reply_markup=get_tutor_main_keyboard())
+    text = format_active_homeworks(get_active_homeworks())
+    await update.message.reply_text(text, reply_markup=TUTOR_MAIN_KEYBOARD)
 
 
 async def list_students_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -473,22 +1078,8 @@ async def list_students_command(update: Update, context: ContextTypes.DEFAULT_TY
 
     context.user_data.clear()
 
-    students = get_students()
-
-    if not students:
-        text = "👥 Нет учеников."
-    else:
-        text = f"👥 Ученики ({len(students)}):\n\n"
-        for s in students:
-            active_hws = len(get_homeworks_for_student(s['telegram_id']))
-            completed_hws = len(
-                [h for h in homeworks_db if h['student_id'] == s['telegram_id'] and h.get('is_completed')])
-            text += f"• {s['full_name']}\n"
-            text += f"  ❤️ Жизни: {s.get('lives', 0)}/{settings['lives']['max_lives']}\n"
-            text += f"  📊 ДЗ: {active_hws} активных, {completed_hws} выполнено\n"
-            text += f"  🕐 Таймзона: {s.get('timezone', 'Не указана')}\n\n"
-
-    await update.message.reply_text(text, reply_markup=get_tutor_main_keyboard())
+    text = format_students(get_students())
+    await update.message.reply_text(text, reply_markup=TUTOR_MAIN_KEYBOARD)
 
 
 async def delete_student_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -509,20 +1100,12 @@ async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     context.user_data.clear()
 
-    keyboard = [
-        [InlineKeyboardButton("🔔 Уведомления", callback_data="settings_notifications")],
-        [InlineKeyboardButton("❤️ Жизни", callback_data="settings_lives")],
-        [InlineKeyboardButton("🕐 Время", callback_data="settings_time")],
-        [InlineKeyboardButton("📊 Статистика", callback_data="settings_stats")],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="cancel")]
-    ]
-
     await update.message.reply_text(
         f"⚙️ Настройки\n\n"
         f"Таймзона: {settings['timezone']}\n"
         f"Уведомления: {'✅' if settings['notifications']['homework_reminders'] else '❌'}\n"
         f"Жизни: {'✅' if settings['lives']['enabled'] else '❌'}",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=SETTINGS_MENU_KEYBOARD
     )
 
 
@@ -534,32 +1117,8 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     context.user_data.clear()
 
-    students = get_students()
-    active_hws = get_active_homeworks()
-    upcoming_lessons = get_upcoming_lessons()
-    late_hws = get_late_homeworks()
-
-    lives_stats = {
-        'full': sum(1 for s in students if s.get('lives', 0) == settings['lives']['max_lives']),
-        'half': sum(1 for s in students if 0 < s.get('lives', 0) < settings['lives']['max_lives']),
-        'zero': sum(1 for s in students if s.get('lives', 0) == 0),
-    }
-
-    text = f"📊 Статистика\n\n"
-    text += f"👥 Учеников: {len(students)}\n"
-    text += f"📚 Активных ДЗ: {len(active_hws)}\n"
-    text += f"⚠️ Просроченных: {len(late_hws)}\n"
-    text += f"🗓 Занятий: {len(upcoming_lessons)}\n\n"
-
-    if settings['lives']['enabled']:
-        text += f"❤️ Жизни:\n"
-        text += f"• Полные: {lives_stats['full']}\n"
-        text += f"• Частичные: {lives_stats['half']}\n"
-        text += f"• Нет: {lives_stats['zero']}\n\n"
-
-    text += f"🕐 Таймзона: {settings['timezone']}"
-
-    await update.message.reply_text(text, reply_markup=get_tutor_main_keyboard())
+    text = format_stats()
+    await update.message.reply_text(text, reply_markup=TUTOR_MAIN_KEYBOARD)
 
 
 async def reset_lives_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -571,13 +1130,13 @@ async def reset_lives_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     context.user_data.clear()
 
     students = get_students()
+    now_utc = datetime.now(utc)
     for student in students:
-        student['lives'] = settings['lives']['max_lives']
-        student['last_life_reset'] = datetime.now(utc).isoformat()
+        reset_user_lives(student, now_utc)
 
     await update.message.reply_text(
         f"✅ Жизни сброшены для всех {len(students)} учеников!",
-        reply_markup=get_tutor_main_keyboard()
+        reply_markup=TUTOR_MAIN_KEYBOARD
     )
 
 
@@ -589,18 +1148,13 @@ async def clear_all_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     context.user_data.clear()
 
-    keyboard = [
-        [InlineKeyboardButton("✅ Да, очистить всё", callback_data="clear_all_confirm")],
-        [InlineKeyboardButton("❌ Нет, отмена", callback_data="cancel")]
-    ]
-
     await update.message.reply_text(
         "⚠️ ВНИМАНИЕ! Вы собираетесь очистить ВСЕ данные:\n\n"
         f"👥 Учеников: {len(get_students())}\n"
         f"📚 ДЗ: {len(homeworks_db)}\n"
         f"🗓 Занятий: {len(lessons_db)}\n\n"
         "Это действие НЕОБРАТИМО! Вы уверены?",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=CLEAR_ALL_KEYBOARD
     )
 
 
@@ -609,7 +1163,7 @@ async def clear_all_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    global users_db, homeworks_db, lessons_db, next_id
+    global next_id
 
     students_count = len(get_students())
     hw_count = len(homeworks_db)
@@ -625,13 +1179,22 @@ async def clear_all_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Очищаем все данные
     users_db.clear()
+    students_by_id.clear()
     homeworks_db.clear()
+    homeworks_by_student.clear()
+    pending_count.clear()
+    completed_count.clear()
+    pending_homeworks.clear()
     lessons_db.clear()
+    lessons_by_student.clear()
     next_id = 1
+    # Снимаем напоминания удалённых ДЗ и занятий: их id будут выданы заново
+    schedule_reminders()
 
     # Восстанавливаем репетитора
     if tutor_data:
         users_db[tutor_id] = tutor_data
+    tutor_ids.intersection_update({TUTOR_ID})
 
     await query.edit_message_text(
         f"✅ Все данные очищены!\n\n"
@@ -640,7 +1203,7 @@ async def clear_all_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"• ДЗ: {hw_count}\n"
         f"• Занятий: {lessons_count}\n\n"
         f"Репетитор сохранён.",
-        reply_markup=get_tutor_main_keyboard()
+        reply_markup=TUTOR_MAIN_KEYBOARD
     )
 
 
@@ -649,64 +1212,14 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.clear()
 
     if is_tutor(update.effective_user.id):
-        help_text = """
-📚 HelperTutor - Умный бот-помощник репетитора
-
-👨‍🏫 Команды репетитора:
-/start - Начать работу
-/menu - Панель управления
-/add_hw - Добавить ДЗ
-/add_lesson - Добавить занятие
-/list_hw - Список ДЗ
-/students - Список учеников
-/delete_student - Удалить ученика
-/settings - Настройки
-/stats - Статистика
-/reset_lives - Сбросить жизни всем
-/clear_all - Очистить все данные (осторожно!)
-/help - Эта справка
-
-📝 Управление через кнопки:
-• Добавление ДЗ и занятий
-• Просмотр статистики
-• Настройки уведомлений
-• Управление учениками
-
-❤️ Система жизней:
-• Настройка штрафов и наград
-• Авто-сброс по расписанию
-• Уведомления ученикам
-
-🕐 Умное время:
-• Поддержка всех таймзон
-• Автоматическая конвертация
-"""
+        help_text = TUTOR_HELP_TEXT
     else:
-        help_text = """
-👨‍🎓 Команды ученика:
-/start - Начать работу
-/help - Эта справка
-
-📝 Управление через кнопки:
-• Отметка выполнения ДЗ
-• Просмотр своих ДЗ
-• Расписание занятий
-• Профиль ученика
-
-❤️ Система жизней:
-• Жизни отнимаются за просрочки
-• Начисляются за досрочное выполнение
-• Автоматический сброс
-
-🔔 Уведомления:
-• Напоминания о ДЗ
-• Уведомления о занятиях
-"""
+        help_text = STUDENT_HELP_TEXT
 
     if update.message:
         await update.message.reply_text(help_text)
     else:
-        await update.callback_query.edit_message_text(help_text)
+        await answer_and_edit(update.callback_query, help_text)
 
 
 # ====================== КОЛБЭКИ ДЛЯ КНОПОК ======================
@@ -722,49 +1235,9 @@ async def tutor_add_hw_start_callback(update: Update, context: ContextTypes.DEFA
 
 async def tutor_add_hw_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Запуск добавления ДЗ"""
-    students = get_students()
-    if not students:
-        if update.callback_query:
-            try:
-                await update.callback_query.edit_message_text(
-                    "Нет учеников. Добавьте учеников через /start",
-                    reply_markup=get_tutor_main_keyboard()
-                )
-            except Exception as e:
-                logger.error(f"Ошибка при редактировании сообщения: {e}")
-                await update.callback_query.message.reply_text(
-                    "Нет учеников. Добавьте учеников через /start",
-                    reply_markup=get_tutor_main_keyboard()
-                )
-        else:
-            await update.message.reply_text(
-                "Нет учеников. Добавьте учеников через /start",
-                reply_markup=get_tutor_main_keyboard()
-            )
+    if not await pick_student(update, "Выберите ученика для ДЗ:", "Нет учеников. Добавьте учеников через /start",
+                              "hw_student", lambda s: f"👤 {s.full_name} ({s.lives}❤️)"):
         return ConversationHandler.END
-
-    keyboard = [[InlineKeyboardButton(f"👤 {s['full_name']} ({s.get('lives', 0)}❤️)",
-                                      callback_data=f"hw_student:{s['telegram_id']}")]
-                for s in students]
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-
-    if update.callback_query:
-        try:
-            await update.callback_query.edit_message_text(
-                "Выберите ученика для ДЗ:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
-            await update.callback_query.message.reply_text(
-                "Выберите ученика для ДЗ:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-    else:
-        await update.message.reply_text(
-            "Выберите ученика для ДЗ:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
     return WAITING_HW_STUDENT
 
 
@@ -778,48 +1251,9 @@ async def tutor_add_lesson_start_callback(update: Update, context: ContextTypes.
 
 async def tutor_add_lesson_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Запуск добавления занятия"""
-    students = get_students()
-    if not students:
-        if update.callback_query:
-            try:
-                await update.callback_query.edit_message_text(
-                    "Нет учеников. Добавьте учеников через /start",
-                    reply_markup=get_tutor_main_keyboard()
-                )
-            except Exception as e:
-                logger.error(f"Ошибка при редактировании сообщения: {e}")
-                await update.callback_query.message.reply_text(
-                    "Нет учеников. Добавьте учеников через /start",
-                    reply_markup=get_tutor_main_keyboard()
-                )
-        else:
-            await update.message.reply_text(
-                "Нет учеников. Добавьте учеников через /start",
-                reply_markup=get_tutor_main_keyboard()
-            )
+    if not await pick_student(update, "Выберите ученика для занятия:", "Нет учеников. Добавьте учеников через /start",
+                              "lesson_student", lambda s: f"👤 {s.full_name}"):
         return ConversationHandler.END
-
-    keyboard = [[InlineKeyboardButton(f"👤 {s['full_name']}", callback_data=f"lesson_student:{s['telegram_id']}")]
-                for s in students]
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-
-    if update.callback_query:
-        try:
-            await update.callback_query.edit_message_text(
-                "Выберите ученика для занятия:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
-            await update.callback_query.message.reply_text(
-                "Выберите ученика для занятия:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-    else:
-        await update.message.reply_text(
-            "Выберите ученика для занятия:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
     return WAITING_LESSON_STUDENT
 
 
@@ -829,25 +1263,13 @@ async def tutor_list_hw_callback(update: Update, context: ContextTypes.DEFAULT_T
 
     context.user_data.clear()
 
-    active = get_active_homeworks()
-
-    if not active:
-        text = "📭 Нет активных ДЗ."
-    else:
-        text = "📚 Активные ДЗ:\n\n"
-        for hw in active[:10]:
-            student = get_user(hw['student_id'])
-            student_tz = student.get('timezone', settings['timezone']) if student else settings['timezone']
-            text += f"👤 {student['full_name'] if student else '???'} ({student.get('lives', 0)}❤️)\n"
-            text += f"📝 {hw['task_text'][:50]}...\n"
-            text += f"📅 {get_local_time(hw['deadline'], student_tz)}\n"
-            text += f"⏰ Таймзона: {student_tz}\n\n"
+    text = format_active_homeworks(get_active_homeworks())
 
     try:
-        await update.callback_query.edit_message_text(text, reply_markup=get_tutor_main_keyboard())
+        await update.callback_query.edit_message_text(text, reply_markup=TUTOR_MAIN_KEYBOARD)
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
-        await update.callback_query.message.reply_text(text, reply_markup=get_tutor_main_keyboard())
+        logger.error("Ошибка при редактировании сообщения: %s", e)
+        await update.callback_query.message.reply_text(text, reply_markup=TUTOR_MAIN_KEYBOARD)
 
 
 async def tutor_list_students_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -856,26 +1278,13 @@ async def tutor_list_students_callback(update: Update, context: ContextTypes.DEF
 
     context.user_data.clear()
 
-    students = get_students()
-
-    if not students:
-        text = "👥 Нет учеников."
-    else:
-        text = f"👥 Ученики ({len(students)}):\n\n"
-        for s in students:
-            active_hws = len(get_homeworks_for_student(s['telegram_id']))
-            completed_hws = len(
-                [h for h in homeworks_db if h['student_id'] == s['telegram_id'] and h.get('is_completed')])
-            text += f"• {s['full_name']}\n"
-            text += f"  ❤️ Жизни: {s.get('lives', 0)}/{settings['lives']['max_lives']}\n"
-            text += f"  📊 ДЗ: {active_hws} активных, {completed_hws} выполнено\n"
-            text += f"  🕐 Таймзона: {s.get('timezone', 'Не указана')}\n\n"
+    text = format_students(get_students())
 
     try:
-        await update.callback_query.edit_message_text(text, reply_markup=get_tutor_main_keyboard())
+        await update.callback_query.edit_message_text(text, reply_markup=TUTOR_MAIN_KEYBOARD)
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
-        await update.callback_query.message.reply_text(text, reply_markup=get_tutor_main_keyboard())
+        logger.error("Ошибка при редактировании сообщения: %s", e)
+        await update.callback_query.message.reply_text(text, reply_markup=TUTOR_MAIN_KEYBOARD)
 
 
 async def tutor_delete_student_start_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -888,48 +1297,9 @@ async def tutor_delete_student_start_callback(update: Update, context: ContextTy
 
 async def tutor_delete_student_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Запуск удаления ученика"""
-    students = get_students()
-    if not students:
-        if update.callback_query:
-            try:
-                await update.callback_query.edit_message_text(
-                    "Нет учеников.",
-                    reply_markup=get_tutor_main_keyboard()
-                )
-            except Exception as e:
-                logger.error(f"Ошибка при редактировании сообщения: {e}")
-                await update.callback_query.message.reply_text(
-                    "Нет учеников.",
-                    reply_markup=get_tutor_main_keyboard()
-                )
-        else:
-            await update.message.reply_text(
-                "Нет учеников.",
-                reply_markup=get_tutor_main_keyboard()
-            )
+    if not await pick_student(update, "Выберите ученика для удаления:", "Нет учеников.",
+                              "delete_student", lambda s: f"🗑 {s.full_name}"):
         return
-
-    keyboard = [[InlineKeyboardButton(f"🗑 {s['full_name']}", callback_data=f"delete_student:{s['telegram_id']}")]
-                for s in students]
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-
-    if update.callback_query:
-        try:
-            await update.callback_query.edit_message_text(
-                "Выберите ученика для удаления:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
-            await update.callback_query.message.reply_text(
-                "Выберите ученика для удаления:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-    else:
-        await update.message.reply_text(
-            "Выберите ученика для удаления:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
     return WAITING_DELETE_STUDENT
 
 
@@ -939,30 +1309,22 @@ async def tutor_settings_start_callback(update: Update, context: ContextTypes.DE
 
     context.user_data.clear()
 
-    keyboard = [
-        [InlineKeyboardButton("🔔 Уведомления", callback_data="settings_notifications")],
-        [InlineKeyboardButton("❤️ Жизни", callback_data="settings_lives")],
-        [InlineKeyboardButton("🕐 Время", callback_data="settings_time")],
-        [InlineKeyboardButton("📊 Статистика", callback_data="settings_stats")],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="cancel")]
-    ]
-
     try:
         await update.callback_query.edit_message_text(
             f"⚙️ Настройки\n\n"
             f"Таймзона: {settings['timezone']}\n"
             f"Уведомления: {'✅' if settings['notifications']['homework_reminders'] else '❌'}\n"
             f"Жизни: {'✅' if settings['lives']['enabled'] else '❌'}",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=SETTINGS_MENU_KEYBOARD
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await update.callback_query.message.reply_text(
             f"⚙️ Настройки\n\n"
             f"Таймзона: {settings['timezone']}\n"
             f"Уведомления: {'✅' if settings['notifications']['homework_reminders'] else '❌'}\n"
             f"Жизни: {'✅' if settings['lives']['enabled'] else '❌'}",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=SETTINGS_MENU_KEYBOARD
         )
     return WAITING_SETTINGS_CHOICE
 
@@ -973,36 +1335,13 @@ async def tutor_stats_callback(update: Update, context: ContextTypes.DEFAULT_TYP
 
     context.user_data.clear()
 
-    students = get_students()
-    active_hws = get_active_homeworks()
-    upcoming_lessons = get_upcoming_lessons()
-    late_hws = get_late_homeworks()
-
-    lives_stats = {
-        'full': sum(1 for s in students if s.get('lives', 0) == settings['lives']['max_lives']),
-        'half': sum(1 for s in students if 0 < s.get('lives', 0) < settings['lives']['max_lives']),
-        'zero': sum(1 for s in students if s.get('lives', 0) == 0),
-    }
-
-    text = f"📊 Статистика\n\n"
-    text += f"👥 Учеников: {len(students)}\n"
-    text += f"📚 Активных ДЗ: {len(active_hws)}\n"
-    text += f"⚠️ Просроченных: {len(late_hws)}\n"
-    text += f"🗓 Занятий: {len(upcoming_lessons)}\n\n"
-
-    if settings['lives']['enabled']:
-        text += f"❤️ Жизни:\n"
-        text += f"• Полные: {lives_stats['full']}\n"
-        text += f"• Частичные: {lives_stats['half']}\n"
-        text += f"• Нет: {lives_stats['zero']}\n\n"
-
-    text += f"🕐 Таймзона: {settings['timezone']}"
+    text = format_stats()
 
     try:
-        await update.callback_query.edit_message_text(text, reply_markup=get_tutor_main_keyboard())
+        await update.callback_query.edit_message_text(text, reply_markup=TUTOR_MAIN_KEYBOARD)
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
-        await update.callback_query.message.reply_text(text, reply_markup=get_tutor_main_keyboard())
+        logger.error("Ошибка при редактировании сообщения: %s", e)
+        await update.callback_query.message.reply_text(text, reply_markup=TUTOR_MAIN_KEYBOARD)
 
 
 # ====================== ДОБАВЛЕНИЕ ДЗ ======================
@@ -1020,13 +1359,13 @@ async def tutor_select_student_hw(update: Update, context: ContextTypes.DEFAULT_
     try:
         await query.edit_message_text(
             "Введите текст ДЗ:",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="cancel")]])
+            reply_markup=CANCEL_KEYBOARD
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             "Введите текст ДЗ:",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="cancel")]])
+            reply_markup=CANCEL_KEYBOARD
         )
     return WAITING_HW_TEXT
 
@@ -1037,12 +1376,12 @@ async def tutor_hw_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     student_id = context.user_data['selected_student']
     student = get_user(student_id)
-    student_tz = student.get('timezone', settings['timezone']) if student else settings['timezone']
+    student_tz = student.timezone if student else settings['timezone']
 
     await update.message.reply_text(
         f"Введите дедлайн (ДД.ММ.ГГГГ ЧЧ:ММ)\n"
         f"Таймзона ученика: {student_tz}\n"
-        f"Пример: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
+        f"Пример: {datetime.now(get_tz(student_tz)).strftime('%d.%m.%Y %H:%M')}"
     )
     return WAITING_HW_DEADLINE
 
@@ -1051,7 +1390,7 @@ async def tutor_hw_deadline(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ввод дедлайна ДЗ"""
     student_id = context.user_data['selected_student']
     student = get_user(student_id)
-    student_tz = student.get('timezone', settings['timezone']) if student else settings['timezone']
+    student_tz = student.timezone if student else settings['timezone']
 
     deadline = parse_datetime(update.message.text, student_tz)
     if not deadline:
@@ -1060,39 +1399,35 @@ async def tutor_hw_deadline(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     hw_text = context.user_data['hw_text']
 
-    hw_id = get_next_id()
-    homeworks_db.append({
-        'id': hw_id,
-        'student_id': student_id,
-        'tutor_id': update.effective_user.id,
-        'task_text': hw_text,
-        'deadline': deadline.isoformat(),
-        'is_completed': False,
-        'late_notified': False,
-        'created_at': datetime.now(utc).isoformat()
-    })
+    hw = Homework(
+        id=get_next_id(),
+        student_id=student_id,
+        tutor_id=update.effective_user.id,
+        task_text=hw_text,
+        deadline=deadline.isoformat(),
+        created_at=datetime.now(utc).isoformat()
+    )
+    add_homework(hw)
 
+    # Ученику - через очередь уведомлений, чтобы ответ репетитору не ждал отправки
     if student:
-        try:
-            await application.bot.send_message(
-                chat_id=student_id,
-                text=f"📚 Новое домашнее задание!\n\n"
-                     f"📝 {hw_text[:200]}...\n"
-                     f"📅 Дедлайн: {get_local_time(deadline.isoformat(), student_tz)}\n"
-                     f"⏰ Таймзона: {student_tz}"
-            )
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомления ученику: {e}")
+        queue_notification(
+            student_id,
+            f"📚 Новое домашнее задание!\n\n"
+            f"📝 {hw_text[:200]}...\n"
+            f"📅 Дедлайн: {get_local_time(deadline, student_tz)}\n"
+            f"⏰ Таймзона: {student_tz}"
+        )
 
     await update.message.reply_text(
-        f"✅ ДЗ добавлено для {student['full_name'] if student else 'ученика'}!\n"
-        f"📅 Дедлайн: {get_local_time(deadline.isoformat(), student_tz)}\n"
+        f"✅ ДЗ добавлено для {student.full_name if student else 'ученика'}!\n"
+        f"📅 Дедлайн: {get_local_time(deadline, student_tz)}\n"
         f"⏰ По таймзоне: {student_tz}",
-        reply_markup=get_tutor_main_keyboard()
+        reply_markup=TUTOR_MAIN_KEYBOARD
     )
 
     context.user_data.clear()
-    schedule_reminders()
+    schedule_homework_reminders(hw)
     return ConversationHandler.END
 
 
@@ -1110,13 +1445,13 @@ async def tutor_select_student_lesson(update: Update, context: ContextTypes.DEFA
     try:
         await query.edit_message_text(
             "Введите тему занятия:",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="cancel")]])
+            reply_markup=CANCEL_KEYBOARD
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             "Введите тему занятия:",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="cancel")]])
+            reply_markup=CANCEL_KEYBOARD
         )
     return WAITING_LESSON_TOPIC
 
@@ -1125,28 +1460,14 @@ async def tutor_lesson_topic(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Ввод темы занятия"""
     context.user_data['lesson_topic'] = update.message.text
 
-    today = datetime.now()
-    keyboard = []
-
-    for i in range(7):
-        date = today + timedelta(days=i)
-        date_str = date.strftime('%d.%m.%Y')
-        weekday = date.strftime('%A')
-        if i == 0:
-            display = f"{date_str} (сегодня)"
-        elif i == 1:
-            display = f"{date_str} (завтра)"
-        elif i == 2:
-            display = f"{date_str} (послезавтра)"
-        else:
-            display = f"{date_str} ({weekday})"
-        keyboard.append([InlineKeyboardButton(display, callback_data=f"lesson_date:{date_str}")])
-
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+    # Даты предлагаем в таймзоне ученика: в ней же потом разбирается время занятия
+    student = get_user(context.user_data['selected_student'])
+    student_tz = student.timezone if student else settings['timezone']
+    today = datetime.now(get_tz(student_tz)).date()
 
     await update.message.reply_text(
         "Выберите дату занятия:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=lesson_date_keyboard(today)
     )
     return WAITING_LESSON_DATE
 
@@ -1159,28 +1480,16 @@ async def tutor_lesson_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     date_str = query.data.split(':')[1]
     context.user_data['lesson_date'] = date_str
 
-    keyboard = []
-    row = []
-    for hour in range(8, 22):
-        row.append(InlineKeyboardButton(f"{hour:02d}:00", callback_data=f"lesson_hour:{hour}"))
-        if len(row) == 4:
-            keyboard.append(row)
-            row = []
-    if row:
-        keyboard.append(row)
-
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-
     try:
         await query.edit_message_text(
             f"Выберите время начала занятия ({date_str}):",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=LESSON_HOUR_KEYBOARD
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             f"Выберите время начала занятия ({date_str}):",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=LESSON_HOUR_KEYBOARD
         )
     return WAITING_LESSON_HOUR
 
@@ -1193,24 +1502,16 @@ async def tutor_lesson_hour(update: Update, context: ContextTypes.DEFAULT_TYPE):
     hour = int(query.data.split(':')[1])
     context.user_data['lesson_hour'] = hour
 
-    keyboard = []
-    row = []
-    for minute in [0, 15, 30, 45]:
-        row.append(InlineKeyboardButton(f"{hour:02d}:{minute:02d}", callback_data=f"lesson_minute:{minute}"))
-    keyboard.append(row)
-
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-
     try:
         await query.edit_message_text(
             "Выберите минуты:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=lesson_minute_keyboard(hour)
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             "Выберите минуты:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=lesson_minute_keyboard(hour)
         )
     return WAITING_LESSON_MINUTE
 
@@ -1228,66 +1529,61 @@ async def tutor_lesson_minute(update: Update, context: ContextTypes.DEFAULT_TYPE
     hour = context.user_data['lesson_hour']
 
     student = get_user(student_id)
-    student_tz = student.get('timezone', settings['timezone']) if student else settings['timezone']
+    student_tz = student.timezone if student else settings['timezone']
 
     dt_str = f"{date_str} {hour:02d}:{minute:02d}"
     lesson_time = parse_datetime(dt_str, student_tz)
 
     if not lesson_time:
         try:
-            await query.edit_message_text("Ошибка при создании времени занятия.", reply_markup=get_tutor_main_keyboard())
+            await query.edit_message_text("Ошибка при создании времени занятия.", reply_markup=TUTOR_MAIN_KEYBOARD)
         except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
-            await query.message.reply_text("Ошибка при создании времени занятия.", reply_markup=get_tutor_main_keyboard())
+            logger.error("Ошибка при редактировании сообщения: %s", e)
+            await query.message.reply_text("Ошибка при создании времени занятия.", reply_markup=TUTOR_MAIN_KEYBOARD)
         context.user_data.clear()
         return ConversationHandler.END
 
-    lesson_id = get_next_id()
-    lessons_db.append({
-        'id': lesson_id,
-        'student_id': student_id,
-        'tutor_id': update.effective_user.id,
-        'topic': topic,
-        'lesson_time': lesson_time.isoformat(),
-        'duration_minutes': 60,
-        'notify_student': True,
-        'created_at': datetime.now(utc).isoformat()
-    })
+    lesson = Lesson(
+        id=get_next_id(),
+        student_id=student_id,
+        tutor_id=update.effective_user.id,
+        topic=topic,
+        lesson_time=lesson_time.isoformat(),
+        created_at=datetime.now(utc).isoformat()
+    )
+    add_lesson(lesson)
 
     if student:
-        try:
-            await application.bot.send_message(
-                chat_id=student_id,
-                text=f"📅 Новое занятие!\n\n"
-                     f"📌 Тема: {topic}\n"
-                     f"🕐 Время: {get_local_time(lesson_time.isoformat(), student_tz)}\n"
-                     f"⏰ Таймзона: {student_tz}"
-            )
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомления ученику: {e}")
+        queue_notification(
+            student_id,
+            f"📅 Новое занятие!\n\n"
+            f"📌 Тема: {topic}\n"
+            f"🕐 Время: {get_local_time(lesson_time, student_tz)}\n"
+            f"⏰ Таймзона: {student_tz}"
+        )
 
     try:
         await query.edit_message_text(
             f"✅ Занятие добавлено!\n\n"
-            f"👤 Ученик: {student['full_name'] if student else '???'}\n"
+            f"👤 Ученик: {student.full_name if student else '???'}\n"
             f"📌 Тема: {topic}\n"
-            f"🕐 Время: {get_local_time(lesson_time.isoformat(), student_tz)}\n"
+            f"🕐 Время: {get_local_time(lesson_time, student_tz)}\n"
             f"⏰ Таймзона: {student_tz}",
-            reply_markup=get_tutor_main_keyboard()
+            reply_markup=TUTOR_MAIN_KEYBOARD
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             f"✅ Занятие добавлено!\n\n"
-            f"👤 Ученик: {student['full_name'] if student else '???'}\n"
+            f"👤 Ученик: {student.full_name if student else '???'}\n"
             f"📌 Тема: {topic}\n"
-            f"🕐 Время: {get_local_time(lesson_time.isoformat(), student_tz)}\n"
+            f"🕐 Время: {get_local_time(lesson_time, student_tz)}\n"
             f"⏰ Таймзона: {student_tz}",
-            reply_markup=get_tutor_main_keyboard()
+            reply_markup=TUTOR_MAIN_KEYBOARD
         )
 
     context.user_data.clear()
-    schedule_reminders()
+    schedule_lesson_reminders(lesson)
     return ConversationHandler.END
 
 
@@ -1297,40 +1593,25 @@ async def tutor_settings_notifications(update: Update, context: ContextTypes.DEF
     query = update.callback_query
     await query.answer()
 
-    keyboard = [
-        [InlineKeyboardButton(
-            f"{'🔔' if settings['notifications']['homework_reminders'] else '🔕'} ДЗ",
-            callback_data="toggle_hw_reminders"
-        )],
-        [InlineKeyboardButton(
-            f"{'🔔' if settings['notifications']['lesson_reminders'] else '🔕'} Занятия",
-            callback_data="toggle_lesson_reminders"
-        )],
-        [InlineKeyboardButton(
-            f"{'🔔' if settings['notifications']['late_homework_alerts'] else '🔕'} Просрочки",
-            callback_data="toggle_late_alerts"
-        )],
-        [InlineKeyboardButton(
-            "⏰ Время ДЗ",
-            callback_data="hw_notification_times"
-        )],
-        [InlineKeyboardButton(
-            "⏰ Время занятий",
-            callback_data="lesson_notification_times"
-        )],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")]
-    ]
+    notifications = settings['notifications']
+    keyboard = notifications_keyboard(
+        notifications['homework_reminders'],
+        notifications['lesson_reminders'],
+        notifications['late_homework_alerts']
+    )
 
+    if message_unchanged(query.message, "🔔 Настройки уведомлений:", keyboard):
+        return WAITING_NOTIFICATION_SETTINGS
     try:
         await query.edit_message_text(
             "🔔 Настройки уведомлений:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=keyboard
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             "🔔 Настройки уведомлений:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=keyboard
         )
     return WAITING_NOTIFICATION_SETTINGS
 
@@ -1347,9 +1628,10 @@ async def toggle_notification_setting(update: Update, context: ContextTypes.DEFA
     }
 
     setting_key, setting_name = setting_map[query.data]
-    settings['notifications'][setting_key] = not settings['notifications'][setting_key]
+    notifications = settings['notifications']
+    notifications[setting_key] = not notifications[setting_key]
 
-    new_state = '✅' if settings['notifications'][setting_key] else '❌'
+    new_state = '✅' if notifications[setting_key] else '❌'
     await query.answer(f"{setting_name}: {new_state}")
 
     schedule_reminders()
@@ -1357,35 +1639,24 @@ async def toggle_notification_setting(update: Update, context: ContextTypes.DEFA
 
 
 async def hw_notification_times(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Настройка времени уведомлений о ДЗ"""
-    query = update.callback_query
-    await query.answer()
-
-    times = [2, 12, 24]
-
-    keyboard = []
-    for time in times:
-        is_active = time in settings['notifications']['homework_times']
-        emoji = "✅" if is_active else "☑️"
-        keyboard.append([
-            InlineKeyboardButton(
-                f"{emoji} {time}ч",
-                callback_data=f"toggle_hw_time:{time}"
-            )
-        ])
+    """Настройка времени уведомлений о ДЗ"""
+    query = update.callback_query
+    await query.answer()
 
-    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="settings_notifications")])
+    keyboard = notification_times_keyboard('toggle_hw_time', frozenset(settings['notifications']['homework_times']))
 
+    if message_unchanged(query.message, "📚 Уведомления о ДЗ:", keyboard):
+        return
     try:
         await query.edit_message_text(
             "📚 Уведомления о ДЗ:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=keyboard
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             "📚 Уведомления о ДЗ:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=keyboard
         )
 
 
@@ -1394,31 +1665,20 @@ async def lesson_notification_times(update: Update, context: ContextTypes.DEFAUL
     query = update.callback_query
     await query.answer()
 
-    times = [2, 12, 24]
-
-    keyboard = []
-    for time in times:
-        is_active = time in settings['notifications']['lesson_times']
-        emoji = "✅" if is_active else "☑️"
-        keyboard.append([
-            InlineKeyboardButton(
-                f"{emoji} {time}ч",
-                callback_data=f"toggle_lesson_time:{time}"
-            )
-        ])
-
-    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="settings_notifications")])
+    keyboard = notification_times_keyboard('toggle_lesson_time', frozenset(settings['notifications']['lesson_times']))
 
+    if message_unchanged(query.message, "🗓 Уведомления о занятиях:", keyboard):
+        return
     try:
         await query.edit_message_text(
             "🗓 Уведомления о занятиях:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=keyboard
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             "🗓 Уведомления о занятиях:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=keyboard
         )
 
 
@@ -1427,32 +1687,21 @@ async def toggle_notification_time(update: Update, context: ContextTypes.DEFAULT
     query = update.callback_query
     await query.answer()
 
-    data = query.data.split(':')
-    time_type = data[0]
-    hours = int(data[1])
+    time_map = {
+        'toggle_hw_time': ('homework_times', hw_notification_times),
+        'toggle_lesson_time': ('lesson_times', lesson_notification_times)
+    }
 
-    if time_type == "toggle_hw_time":
-        if hours in settings['notifications']['homework_times']:
-            settings['notifications']['homework_times'].remove(hours)
-        else:
-            settings['notifications']['homework_times'].append(hours)
-            settings['notifications']['homework_times'].sort()
-    elif time_type == "toggle_lesson_time":
-        if hours in settings['notifications']['lesson_times']:
-            settings['notifications']['lesson_times'].remove(hours)
-        else:
-            settings['notifications']['lesson_times'].append(hours)
-            settings['notifications']['lesson_times'].sort()
+    time_type, hours = query.data.split(':')
+    hours = int(hours)
+    times_key, show_times = time_map[time_type]
+    times = settings['notifications'][times_key]
+    times ^= {hours}
 
-    await query.answer(
-        f"Напоминание за {hours}ч: {'✅' if hours in settings['notifications']['homework_times'] else '❌'}")
+    await query.answer(f"Напоминание за {hours}ч: {'✅' if hours in times else '❌'}")
 
     schedule_reminders()
-
-    if time_type == "toggle_hw_time":
-        await hw_notification_times(update, context)
-    else:
-        await lesson_notification_times(update, context)
+    await show_times(update, context)
 
 
 # ====================== НАСТРОЙКИ ЖИЗНЕЙ ======================
@@ -1461,48 +1710,29 @@ async def tutor_settings_lives(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
 
-    keyboard = [
-        [InlineKeyboardButton(
-            f"{'❤️' if settings['lives']['enabled'] else '💔'} Система",
-            callback_data="toggle_lives_system"
-        )],
-        [InlineKeyboardButton(
-            f"🔢 Макс: {settings['lives']['max_lives']}",
-            callback_data="set_max_lives"
-        )],
-        [InlineKeyboardButton(
-            f"➖ Просрочка: {settings['lives']['penalty_late']}",
-            callback_data="set_penalty_late"
-        )],
-        [InlineKeyboardButton(
-            f"➖ Занятие: {settings['lives']['penalty_lesson']}",
-            callback_data="set_penalty_lesson"
-        )],
-        [InlineKeyboardButton(
-            f"➕ Досрочно: {settings['lives']['reward_early']}",
-            callback_data="set_reward_early"
-        )],
-        [InlineKeyboardButton(
-            f"🔄 Сброс: {settings['lives']['auto_reset_days']}д",
-            callback_data="set_reset_days"
-        )],
-        [InlineKeyboardButton(
-            f"{'👁️' if settings['lives']['show_to_student'] else '🙈'} Показ",
-            callback_data="toggle_show_lives"
-        )],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")]
-    ]
+    lives_settings = settings['lives']
+    keyboard = lives_settings_keyboard(
+        lives_settings['enabled'],
+        lives_settings['max_lives'],
+        lives_settings['penalty_late'],
+        lives_settings['penalty_lesson'],
+        lives_settings['reward_early'],
+        lives_settings['auto_reset_days'],
+        lives_settings['show_to_student']
+    )
 
+    if message_unchanged(query.message, "❤️ Настройки жизней:", keyboard):
+        return WAITING_LIVES_SETTINGS
     try:
         await query.edit_message_text(
             "❤️ Настройки жизней:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=keyboard
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             "❤️ Настройки жизней:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=keyboard
         )
     return WAITING_LIVES_SETTINGS
 
@@ -1512,14 +1742,17 @@ async def toggle_lives_setting(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
 
-    if query.data == "toggle_lives_system":
-        settings['lives']['enabled'] = not settings['lives']['enabled']
-        new_state = '✅' if settings['lives']['enabled'] else '❌'
-        await query.answer(f"Система жизней: {new_state}")
-    elif query.data == "toggle_show_lives":
-        settings['lives']['show_to_student'] = not settings['lives']['show_to_student']
-        new_state = '✅' if settings['lives']['show_to_student'] else '❌'
-        await query.answer(f"Показывать жизни: {new_state}")
+    setting_map = {
+        'toggle_lives_system': ('enabled', 'Система жизней'),
+        'toggle_show_lives': ('show_to_student', 'Показывать жизни')
+    }
+
+    setting_key, setting_name = setting_map[query.data]
+    lives_settings = settings['lives']
+    lives_settings[setting_key] = not lives_settings[setting_key]
+
+    new_state = '✅' if lives_settings[setting_key] else '❌'
+    await query.answer(f"{setting_name}: {new_state}")
 
     await tutor_settings_lives(update, context)
 
@@ -1547,14 +1780,14 @@ async def set_lives_value_start(update: Update, context: ContextTypes.DEFAULT_TY
         await query.edit_message_text(
             f"Введите новое значение для '{setting_name}':\n"
             f"Текущее: {current_value}",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="settings_lives")]])
+            reply_markup=LIVES_CANCEL_KEYBOARD
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             f"Введите новое значение для '{setting_name}':\n"
             f"Текущее: {current_value}",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="settings_lives")]])
+            reply_markup=LIVES_CANCEL_KEYBOARD
         )
     return WAITING_LIVES_SETTINGS
 
@@ -1572,13 +1805,12 @@ async def set_lives_value_save(update: Update, context: ContextTypes.DEFAULT_TYP
         settings['lives'][setting_key] = new_value
 
         if setting_key == 'max_lives':
-            for user in users_db.values():
-                if user.get('role') == 'student':
-                    user['lives'] = min(user.get('lives', new_value), new_value)
+            for user in students_by_id.values():
+                user.lives = min(user.lives, new_value)
 
         await update.message.reply_text(
             f"✅ Сохранено: {new_value}",
-            reply_markup=get_tutor_main_keyboard()
+            reply_markup=TUTOR_MAIN_KEYBOARD
         )
 
         context.user_data.clear()
@@ -1595,37 +1827,22 @@ async def tutor_settings_time(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     await query.answer()
 
-    popular_timezones = [
-        'Europe/Moscow', 'Europe/Kaliningrad',
-        'Asia/Yekaterinburg', 'Asia/Omsk',
-        'Asia/Vladivostok', 'Europe/Minsk',
-        'Asia/Almaty', 'Asia/Tashkent'
-    ]
-
-    keyboard = []
-    for tz in popular_timezones:
-        display_name = tz.split('/')[-1].replace('_', ' ')
-        if tz == settings['timezone']:
-            keyboard.append([InlineKeyboardButton(f"✅ {display_name}", callback_data=f"timezone:{tz}")])
-        else:
-            keyboard.append([InlineKeyboardButton(f"{display_name}", callback_data=f"timezone:{tz}")])
-
-    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")])
+    keyboard = timezone_keyboard(settings['timezone'])
 
     try:
         await query.edit_message_text(
             f"🕐 Настройки времени\n\n"
             f"Текущая: {settings['timezone']}\n"
             f"Время: {get_local_time()}",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=keyboard
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             f"🕐 Настройки времени\n\n"
             f"Текущая: {settings['timezone']}\n"
             f"Время: {get_local_time()}",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=keyboard
         )
     return WAITING_TIMEZONE_SETTINGS
 
@@ -1638,22 +1855,22 @@ async def set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     new_timezone = query.data.split(':')[1]
     settings['timezone'] = new_timezone
 
-    for user in users_db.values():
-        if user.get('role') == 'student' and not user.get('timezone'):
-            user['timezone'] = new_timezone
+    for user in students_by_id.values():
+        if not user.timezone:
+            user.timezone = new_timezone
 
     try:
         await query.edit_message_text(
             f"✅ Таймзона: {new_timezone}\n"
             f"🕐 Время: {get_local_time()}",
-            reply_markup=get_tutor_main_keyboard()
+            reply_markup=TUTOR_MAIN_KEYBOARD
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             f"✅ Таймзона: {new_timezone}\n"
             f"🕐 Время: {get_local_time()}",
-            reply_markup=get_tutor_main_keyboard()
+            reply_markup=TUTOR_MAIN_KEYBOARD
         )
 
     schedule_reminders()
@@ -1671,10 +1888,10 @@ async def tutor_delete_student_confirm(update: Update, context: ContextTypes.DEF
 
     if not student:
         try:
-            await query.edit_message_text("❌ Ученик не найден.", reply_markup=get_tutor_main_keyboard())
+            await query.edit_message_text("❌ Ученик не найден.", reply_markup=TUTOR_MAIN_KEYBOARD)
         except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
-            await query.message.reply_text("❌ Ученик не найден.", reply_markup=get_tutor_main_keyboard())
+            logger.error("Ошибка при редактировании сообщения: %s", e)
+            await query.message.reply_text("❌ Ученик не найден.", reply_markup=TUTOR_MAIN_KEYBOARD)
         return ConversationHandler.END
 
     keyboard = [
@@ -1685,17 +1902,17 @@ async def tutor_delete_student_confirm(update: Update, context: ContextTypes.DEF
     try:
         await query.edit_message_text(
             f"⚠️ Удалить ученика?\n\n"
-            f"👤 {student['full_name']}\n"
-            f"📊 ДЗ: {len(get_homeworks_for_student(student_id))}\n\n"
+            f"👤 {student.full_name}\n"
+            f"📊 ДЗ: {pending_count[student_id]}\n\n"
             f"Все данные будут удалены!",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             f"⚠️ Удалить ученика?\n\n"
-            f"👤 {student['full_name']}\n"
-            f"📊 ДЗ: {len(get_homeworks_for_student(student_id))}\n\n"
+            f"👤 {student.full_name}\n"
+            f"📊 ДЗ: {pending_count[student_id]}\n\n"
             f"Все данные будут удалены!",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
@@ -1711,30 +1928,29 @@ async def tutor_delete_student_execute(update: Update, context: ContextTypes.DEF
 
     if student:
         del users_db[student_id]
+        students_by_id.pop(student_id, None)
 
-        global homeworks_db
-        homeworks_db = [h for h in homeworks_db if h['student_id'] != student_id]
+        remove_student_homeworks(student_id)
 
-        global lessons_db
-        lessons_db = [l for l in lessons_db if l['student_id'] != student_id]
+        remove_student_lessons(student_id)
 
         try:
             await query.edit_message_text(
-                f"✅ Ученик {student['full_name']} удален!",
-                reply_markup=get_tutor_main_keyboard()
+                f"✅ Ученик {student.full_name} удален!",
+                reply_markup=TUTOR_MAIN_KEYBOARD
             )
         except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
+            logger.error("Ошибка при редактировании сообщения: %s", e)
             await query.message.reply_text(
-                f"✅ Ученик {student['full_name']} удален!",
-                reply_markup=get_tutor_main_keyboard()
+                f"✅ Ученик {student.full_name} удален!",
+                reply_markup=TUTOR_MAIN_KEYBOARD
             )
     else:
         try:
-            await query.edit_message_text("❌ Ученик не найден.", reply_markup=get_tutor_main_keyboard())
+            await query.edit_message_text("❌ Ученик не найден.", reply_markup=TUTOR_MAIN_KEYBOARD)
         except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
-            await query.message.reply_text("❌ Ученик не найден.", reply_markup=get_tutor_main_keyboard())
+            logger.error("Ошибка при редактировании сообщения: %s", e)
+            await query.message.reply_text("❌ Ученик не найден.", reply_markup=TUTOR_MAIN_KEYBOARD)
 
     return ConversationHandler.END
 
@@ -1747,34 +1963,33 @@ async def student_hw_done_callback(update: Update, context: ContextTypes.DEFAULT
     context.user_data.clear()
 
     user_id = update.effective_user.id
-    student_hws = [h for h in homeworks_db if h['student_id'] == user_id and not h.get('is_completed')]
 
-    if not student_hws:
+    if not pending_count[user_id]:
         try:
-            await update.callback_query.edit_message_text("📭 Нет активных ДЗ.", reply_markup=get_student_main_keyboard())
+            await update.callback_query.edit_message_text("📭 Нет активных ДЗ.", reply_markup=STUDENT_MAIN_KEYBOARD)
         except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
-            await update.callback_query.message.reply_text("📭 Нет активных ДЗ.", reply_markup=get_student_main_keyboard())
+            logger.error("Ошибка при редактировании сообщения: %s", e)
+            await update.callback_query.message.reply_text("📭 Нет активных ДЗ.", reply_markup=STUDENT_MAIN_KEYBOARD)
         return
 
+    now_ts = datetime.now(utc).timestamp()
     keyboard = []
-    for hw in student_hws[:5]:
-        deadline = datetime.fromisoformat(hw['deadline'].replace('Z', '+00:00'))
-        now = datetime.now(utc)
-        is_early = deadline > now
+    for hw in get_homeworks_for_student(user_id)[:5]:
+        is_early = hw.deadline_ts > now_ts
 
         emoji = "✅" if is_early else "⚠️"
         status = " (досрочно)" if is_early else " (просрочено)"
 
         keyboard.append([InlineKeyboardButton(
-            f"{emoji} {hw['task_text'][:30]}...{status}",
-            callback_data=f"complete_hw:{hw['id']}"
+            f"{emoji} {hw.task_text[:30]}...{status}",
+            callback_data=f"complete_hw:{hw.id}"
         )])
 
     keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
 
     student = get_user(user_id)
-    lives_text = f"\n❤️ Жизни: {student.get('lives', 0)}/{settings['lives']['max_lives']}" if settings['lives']['enabled'] else ""
+    lives_settings = settings['lives']
+    lives_text = f"\n❤️ Жизни: {student.lives}/{lives_settings['max_lives']}" if lives_settings['enabled'] else ""
 
     try:
         await update.callback_query.edit_message_text(
@@ -1782,7 +1997,7 @@ async def student_hw_done_callback(update: Update, context: ContextTypes.DEFAULT
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await update.callback_query.message.reply_text(
             f"📚 Выберите ДЗ:{lives_text}",
             reply_markup=InlineKeyboardMarkup(keyboard)
@@ -1799,58 +2014,63 @@ async def complete_homework(update: Update, context: ContextTypes.DEFAULT_TYPE):
     hw_id = int(query.data.split(':')[1])
     user_id = update.effective_user.id
 
-    hw = next((h for h in homeworks_db if h['id'] == hw_id and h['student_id'] == user_id), None)
+    # Ищем только невыполненное ДЗ и сразу отмечаем его, без await между поиском
+    # и записью: повторное нажатие кнопки уже не начислит жизни второй раз
+    hw = homeworks_db.get(hw_id)
 
-    if not hw:
+    if not hw or hw.student_id != user_id or hw.is_completed:
         try:
-            await query.edit_message_text("❌ ДЗ не найдено.", reply_markup=get_student_main_keyboard())
+            await query.edit_message_text("❌ ДЗ не найдено.", reply_markup=STUDENT_MAIN_KEYBOARD)
         except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
-            await query.message.reply_text("❌ ДЗ не найдено.", reply_markup=get_student_main_keyboard())
+            logger.error("Ошибка при редактировании сообщения: %s", e)
+            await query.message.reply_text("❌ ДЗ не найдено.", reply_markup=STUDENT_MAIN_KEYBOARD)
         return
 
-    hw['is_completed'] = True
-    hw['completed_at'] = datetime.now(utc).isoformat()
-
-    deadline = datetime.fromisoformat(hw['deadline'].replace('Z', '+00:00'))
     now = datetime.now(utc)
-    is_early = deadline > now
+    mark_homework_completed(hw, now.isoformat())
+
+    is_early = hw.deadline_ts > now.timestamp()
 
     student = get_user(user_id)
-    tutor = get_user(hw['tutor_id'])
+    tutor = get_user(hw.tutor_id)
 
+    lives_settings = settings['lives']
+    lives_enabled = lives_settings['enabled']
     lives_change = 0
-    if settings['lives']['enabled']:
+    if lives_enabled:
         if is_early:
-            reward = settings['lives']['reward_early']
+            reward = lives_settings['reward_early']
             if reward > 0:
-                new_lives = await update_lives(user_id, reward, f"Начислено {reward}❤️ за досрочное выполнение")
+                await update_lives(user_id, reward, f"Начислено {reward}❤️ за досрочное выполнение")
                 lives_change = reward
 
     if tutor:
         time_status = "досрочно" if is_early else "с опозданием"
-        message = f"🎉 {student['full_name']} выполнил ДЗ {time_status}!\n\n📝 {hw['task_text'][:100]}..."
+        message = f"🎉 {student.full_name} выполнил ДЗ {time_status}!\n\n📝 {hw.task_preview_long}..."
         if lives_change > 0:
             message += f"\n❤️ +{lives_change} жизней"
 
-        await application.bot.send_message(chat_id=tutor['telegram_id'], text=message)
+        # Уведомление репетитору уходит через очередь: ученик получает ответ сразу,
+        # а несколько сдач подряд приходят репетитору одним сообщением
+        queue_notification(tutor.telegram_id, message)
 
-    response = "✅ ДЗ выполнено!\n\n"
+    parts = ["✅ ДЗ выполнено!\n\n"]
     if is_early:
-        response += "🎉 Вы сдали досрочно!\n"
+        parts.append("🎉 Вы сдали досрочно!\n")
         if lives_change > 0:
-            response += f"❤️ +{lives_change} жизней\n"
+            parts.append(f"❤️ +{lives_change} жизней\n")
     else:
-        response += "⚠️ Вы сдали с опозданием\n"
+        parts.append("⚠️ Вы сдали с опозданием\n")
 
-    if student and settings['lives']['enabled']:
-        response += f"\n❤️ Жизни: {student.get('lives', 0)}/{settings['lives']['max_lives']}"
+    if student and lives_enabled:
+        parts.append(f"\n❤️ Жизни: {student.lives}/{lives_settings['max_lives']}")
+    response = "".join(parts)
 
     try:
-        await query.edit_message_text(response, reply_markup=get_student_main_keyboard())
+        await query.edit_message_text(response, reply_markup=STUDENT_MAIN_KEYBOARD)
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
-        await query.message.reply_text(response, reply_markup=get_student_main_keyboard())
+        logger.error("Ошибка при редактировании сообщения: %s", e)
+        await query.message.reply_text(response, reply_markup=STUDENT_MAIN_KEYBOARD)
 
 
 async def student_my_hw_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1860,40 +2080,41 @@ async def student_my_hw_callback(update: Update, context: ContextTypes.DEFAULT_T
     context.user_data.clear()
 
     user_id = update.effective_user.id
-    student_hws = [h for h in homeworks_db if h['student_id'] == user_id]
+    student_hws = get_all_homeworks_for_student(user_id)
 
     student = get_user(user_id)
-    student_tz = student.get('timezone', settings['timezone']) if student else settings['timezone']
+    student_tz = student.timezone if student else settings['timezone']
 
     if not student_hws:
         text = "📭 У вас нет ДЗ."
     else:
-        active = [h for h in student_hws if not h.get('is_completed')]
-        completed = [h for h in student_hws if h.get('is_completed')]
+        active = [h for h in student_hws if not h.is_completed]
+        completed = [h for h in student_hws if h.is_completed]
 
-        text = f"📚 Ваши ДЗ\n\n"
-        if settings['lives']['enabled']:
-            text += f"❤️ Жизни: {student.get('lives', 0)}/{settings['lives']['max_lives']}\n\n"
+        lines = ["📚 Ваши ДЗ\n\n"]
+        lives_settings = settings['lives']
+        if lives_settings['enabled']:
+            lines.append(f"❤️ Жизни: {student.lives}/{lives_settings['max_lives']}\n\n")
 
         if active:
-            text += "⏳ Активные:\n"
+            lines.append("⏳ Активные:\n")
             for hw in active[:3]:
-                deadline_str = get_local_time(hw['deadline'], student_tz)
-                text += f"• {hw['task_text'][:40]}...\n"
-                text += f"  📅 {deadline_str}\n\n"
+                deadline_str = get_local_time(hw.deadline_dt, student_tz)
+                lines.append(f"• {hw.task_text[:40]}...\n  📅 {deadline_str}\n\n")
 
         if completed:
-            text += "✅ Выполненные:\n"
+            lines.append("✅ Выполненные:\n")
             for hw in completed[-3:]:
-                completed_at = get_local_time(hw.get('completed_at'), student_tz)
-                text += f"• {hw['task_text'][:40]}...\n"
-                text += f"  🏁 {completed_at}\n\n"
+                completed_at = get_local_time(hw.completed_at, student_tz)
+                lines.append(f"• {hw.task_text[:40]}...\n  🏁 {completed_at}\n\n")
+
+        text = "".join(lines)
 
     try:
-        await update.callback_query.edit_message_text(text, reply_markup=get_student_main_keyboard())
+        await update.callback_query.edit_message_text(text, reply_markup=STUDENT_MAIN_KEYBOARD)
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
-        await update.callback_query.message.reply_text(text, reply_markup=get_student_main_keyboard())
+        logger.error("Ошибка при редактировании сообщения: %s", e)
+        await update.callback_query.message.reply_text(text, reply_markup=STUDENT_MAIN_KEYBOARD)
 
 
 async def student_schedule_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1903,26 +2124,25 @@ async def student_schedule_callback(update: Update, context: ContextTypes.DEFAUL
     context.user_data.clear()
 
     user_id = update.effective_user.id
-    student_lessons = [l for l in lessons_db
-                       if l['student_id'] == user_id and l['lesson_time'] > datetime.now(utc).isoformat()]
+    student_lessons = get_upcoming_lessons(student_id=user_id)
 
     student = get_user(user_id)
-    student_tz = student.get('timezone', settings['timezone']) if student else settings['timezone']
+    student_tz = student.timezone if student else settings['timezone']
 
     if not student_lessons:
         text = "🗓 Нет занятий."
     else:
-        text = "🗓 Расписание:\n\n"
+        lines = ["🗓 Расписание:\n\n"]
         for lesson in student_lessons[:5]:
-            lesson_time = get_local_time(lesson['lesson_time'], student_tz)
-            text += f"📅 {lesson_time}\n"
-            text += f"📌 {lesson.get('topic', 'Без темы')}\n\n"
+            lesson_time = get_local_time(lesson.lesson_time_dt, student_tz)
+            lines.append(f"📅 {lesson_time}\n📌 {lesson.topic}\n\n")
+        text = "".join(lines)
 
     try:
-        await update.callback_query.edit_message_text(text, reply_markup=get_student_main_keyboard())
+        await update.callback_query.edit_message_text(text, reply_markup=STUDENT_MAIN_KEYBOARD)
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
-        await update.callback_query.message.reply_text(text, reply_markup=get_student_main_keyboard())
+        logger.error("Ошибка при редактировании сообщения: %s", e)
+        await update.callback_query.message.reply_text(text, reply_markup=STUDENT_MAIN_KEYBOARD)
 
 
 async def student_profile_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1936,138 +2156,74 @@ async def student_profile_callback(update: Update, context: ContextTypes.DEFAULT
 
     if not student:
         try:
-            await update.callback_query.edit_message_text("❌ Профиль не найден.", reply_markup=get_student_main_keyboard())
+            await update.callback_query.edit_message_text("❌ Профиль не найден.", reply_markup=STUDENT_MAIN_KEYBOARD)
         except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
-            await update.callback_query.message.reply_text("❌ Профиль не найден.", reply_markup=get_student_main_keyboard())
+            logger.error("Ошибка при редактировании сообщения: %s", e)
+            await update.callback_query.message.reply_text("❌ Профиль не найден.", reply_markup=STUDENT_MAIN_KEYBOARD)
         return
 
-    active_hws = len(get_homeworks_for_student(user_id))
-    completed_hws = len([h for h in homeworks_db if h['student_id'] == user_id and h.get('is_completed')])
+    active_hws = pending_count[user_id]
+    completed_hws = completed_count[user_id]
 
+    lives_settings = settings['lives']
+    lives_enabled = lives_settings['enabled']
     next_reset = "Не настроено"
-    if settings['lives']['enabled'] and student.get('last_life_reset'):
-        try:
-            last_reset = datetime.fromisoformat(student['last_life_reset'].replace('Z', '+00:00'))
-            next_reset_date = last_reset + timedelta(days=settings['lives']['auto_reset_days'])
-            next_reset = get_local_time(next_reset_date.isoformat(), student.get('timezone'))
-        except:
-            pass
-
-    text = f"👤 Профиль\n\n"
-    text += f"📝 {student['full_name']}\n"
-    text += f"🕐 Таймзона: {student.get('timezone', settings['timezone'])}\n\n"
-
-    text += f"📊 Статистика:\n"
-    text += f"• Активных ДЗ: {active_hws}\n"
-    text += f"• Выполнено: {completed_hws}\n\n"
-
-    if settings['lives']['enabled']:
-        text += f"❤️ Жизни:\n"
-        text += f"• Текущие: {student.get('lives', 0)}/{settings['lives']['max_lives']}\n"
-        text += f"• След. сброс: {next_reset}\n\n"
+    if lives_enabled:
+        next_reset_date = student.last_life_reset_dt + timedelta(days=lives_settings['auto_reset_days'])
+        next_reset = get_local_time(next_reset_date, student.timezone)
+
+    parts = [
+        "👤 Профиль\n\n"
+        f"📝 {student.full_name}\n"
+        f"🕐 Таймзона: {student.timezone}\n\n"
+        "📊 Статистика:\n"
+        f"• Активных ДЗ: {active_hws}\n"
+        f"• Выполнено: {completed_hws}\n\n"
+    ]
 
-    text += f"🕐 Время: {get_local_time(None, student.get('timezone'))}"
+    if lives_enabled:
+        parts.append(
+            "❤️ Жизни:\n"
+            f"• Текущие: {student.lives}/{lives_settings['max_lives']}\n"
+            f"• След. сброс: {next_reset}\n\n"
+        )
 
-    keyboard = [
-        [InlineKeyboardButton("🔄 Обновить", callback_data="student_profile")],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]
-    ]
+    parts.append(f"🕐 Время: {get_local_time(None, student.timezone)}")
+    text = "".join(parts)
 
     try:
-        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        await update.callback_query.edit_message_text(text, reply_markup=PROFILE_KEYBOARD)
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
-        await update.callback_query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+        logger.error("Ошибка при редактировании сообщения: %s", e)
+        await update.callback_query.message.reply_text(text, reply_markup=PROFILE_KEYBOARD)
 
 
 # ====================== ОБРАБОТЧИКИ ОТМЕНЫ ======================
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отмена"""
     context.user_data.clear()
-    user_id = update.effective_user.id
+    keyboard = TUTOR_MAIN_KEYBOARD if is_tutor(update.effective_user.id) else STUDENT_MAIN_KEYBOARD
 
     if update.callback_query:
-        await update.callback_query.answer()
-        try:
-            if is_tutor(user_id):
-                await update.callback_query.edit_message_text(
-                    "❌ Отменено",
-                    reply_markup=get_tutor_main_keyboard()
-                )
-            else:
-                await update.callback_query.edit_message_text(
-                    "❌ Отменено",
-                    reply_markup=get_student_main_keyboard()
-                )
-        except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
-            if is_tutor(user_id):
-                await update.callback_query.message.reply_text(
-                    "❌ Отменено",
-                    reply_markup=get_tutor_main_keyboard()
-                )
-            else:
-                await update.callback_query.message.reply_text(
-                    "❌ Отменено",
-                    reply_markup=get_student_main_keyboard()
-                )
+        await answer_and_edit(update.callback_query, "❌ Отменено", keyboard)
     elif update.message:
-        if is_tutor(user_id):
-            await update.message.reply_text(
-                "❌ Отменено",
-                reply_markup=get_tutor_main_keyboard()
-            )
-        else:
-            await update.message.reply_text(
-                "❌ Отменено",
-                reply_markup=get_student_main_keyboard()
-            )
+        await update.message.reply_text("❌ Отменено", reply_markup=keyboard)
 
     return ConversationHandler.END
 
 
 async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Возврат в главное меню"""
-    user_id = update.effective_user.id
     context.user_data.clear()
+    if is_tutor(update.effective_user.id):
+        text, keyboard = "📊 Панель управления:", TUTOR_MAIN_KEYBOARD
+    else:
+        text, keyboard = "Главное меню:", STUDENT_MAIN_KEYBOARD
 
     if update.callback_query:
-        await update.callback_query.answer()
-        try:
-            if is_tutor(user_id):
-                await update.callback_query.edit_message_text(
-                    "📊 Панель управления:",
-                    reply_markup=get_tutor_main_keyboard()
-                )
-            else:
-                await update.callback_query.edit_message_text(
-                    "Главное меню:",
-                    reply_markup=get_student_main_keyboard()
-                )
-        except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения: {e}")
-            if is_tutor(user_id):
-                await update.callback_query.message.reply_text(
-                    "📊 Панель управления:",
-                    reply_markup=get_tutor_main_keyboard()
-                )
-            else:
-                await update.callback_query.message.reply_text(
-                    "Главное меню:",
-                    reply_markup=get_student_main_keyboard()
-                )
+        await answer_and_edit(update.callback_query, text, keyboard)
     elif update.message:
-        if is_tutor(user_id):
-            await update.message.reply_text(
-                "📊 Панель управления:",
-                reply_markup=get_tutor_main_keyboard()
-            )
-        else:
-            await update.message.reply_text(
-                "Главное меню:",
-                reply_markup=get_student_main_keyboard()
-            )
+        await update.message.reply_text(text, reply_markup=keyboard)
 
     return ConversationHandler.END
 
@@ -2079,79 +2235,283 @@ async def settings_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     context.user_data.clear()
 
-    keyboard = [
-        [InlineKeyboardButton("🔔 Уведомления", callback_data="settings_notifications")],
-        [InlineKeyboardButton("❤️ Жизни", callback_data="settings_lives")],
-        [InlineKeyboardButton("🕐 Время", callback_data="settings_time")],
-        [InlineKeyboardButton("📊 Статистика", callback_data="settings_stats")],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="cancel")]
-    ]
-
     try:
         await query.edit_message_text(
             f"⚙️ Настройки\n\n"
             f"Таймзона: {settings['timezone']}\n"
             f"Уведомления: {'✅' if settings['notifications']['homework_reminders'] else '❌'}\n"
             f"Жизни: {'✅' if settings['lives']['enabled'] else '❌'}",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=SETTINGS_MENU_KEYBOARD
         )
     except Exception as e:
-        logger.error(f"Ошибка при редактировании сообщения: {e}")
+        logger.error("Ошибка при редактировании сообщения: %s", e)
         await query.message.reply_text(
             f"⚙️ Настройки\n\n"
             f"Таймзона: {settings['timezone']}\n"
             f"Уведомления: {'✅' if settings['notifications']['homework_reminders'] else '❌'}\n"
             f"Жизни: {'✅' if settings['lives']['enabled'] else '❌'}",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=SETTINGS_MENU_KEYBOARD
         )
     return WAITING_SETTINGS_CHOICE
 
 
 # ====================== КЛАВИАТУРЫ ======================
-def get_tutor_main_keyboard():
-    """Клавиатура репетитора"""
-    keyboard = [
-        [
-            InlineKeyboardButton("📝 ДЗ", callback_data='tutor_add_hw'),
-            InlineKeyboardButton("🗓 Занятие", callback_data='tutor_add_lesson')
-        ],
-        [
-            InlineKeyboardButton("📋 Список", callback_data='tutor_list_hw'),
-            InlineKeyboardButton("👥 Ученики", callback_data='tutor_list_students')
-        ],
-        [
-            InlineKeyboardButton("⚙️ Настройки", callback_data='tutor_settings'),
-            InlineKeyboardButton("📊 Статистика", callback_data='tutor_stats')
-        ],
-        [
-            InlineKeyboardButton("❌ Удалить", callback_data='tutor_delete_student'),
-            InlineKeyboardButton("❓ Помощь", callback_data='help')
-        ]
+# Главные меню не меняются, поэтому собираем разметку один раз при загрузке модуля
+TUTOR_MAIN_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📝 ДЗ", callback_data='tutor_add_hw'),
+        InlineKeyboardButton("🗓 Занятие", callback_data='tutor_add_lesson')
+    ],
+    [
+        InlineKeyboardButton("📋 Список", callback_data='tutor_list_hw'),
+        InlineKeyboardButton("👥 Ученики", callback_data='tutor_list_students')
+    ],
+    [
+        InlineKeyboardButton("⚙️ Настройки", callback_data='tutor_settings'),
+        InlineKeyboardButton("📊 Статистика", callback_data='tutor_stats')
+    ],
+    [
+        InlineKeyboardButton("❌ Удалить", callback_data='tutor_delete_student'),
+        InlineKeyboardButton("❓ Помощь", callback_data='help')
+    ]
+])
+
+STUDENT_MAIN_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("✅ ДЗ", callback_data='student_hw_done'),
+        InlineKeyboardButton("📚 Мои ДЗ", callback_data='student_my_hw')
+    ],
+    [
+        InlineKeyboardButton("🗓 Расписание", callback_data='student_schedule'),
+        InlineKeyboardButton("👤 Профиль", callback_data='student_profile')
+    ],
+    [
+        InlineKeyboardButton("❓ Помощь", callback_data='help')
     ]
+])
+
+# Статичные клавиатуры разделов
+SETTINGS_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔔 Уведомления", callback_data="settings_notifications")],
+    [InlineKeyboardButton("❤️ Жизни", callback_data="settings_lives")],
+    [InlineKeyboardButton("🕐 Время", callback_data="settings_time")],
+    [InlineKeyboardButton("📊 Статистика", callback_data="settings_stats")],
+    [InlineKeyboardButton("⬅️ Назад", callback_data="cancel")]
+])
+
+CANCEL_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="cancel")]])
+
+LIVES_CANCEL_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="settings_lives")]])
+
+CLEAR_ALL_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Да, очистить всё", callback_data="clear_all_confirm")],
+    [InlineKeyboardButton("❌ Нет, отмена", callback_data="cancel")]
+])
+
+PROFILE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Обновить", callback_data="student_profile")],
+    [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]
+])
+
+# Выбор часа занятия: 08:00-21:00 по четыре кнопки в ряд
+LESSON_HOUR_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(f"{hour:02d}:00", callback_data=f"lesson_hour:{hour}")
+      for hour in range(start, min(start + 4, 22))]
+     for start in range(8, 22, 4)]
+    + [[InlineKeyboardButton("❌ Отмена", callback_data="cancel")]]
+)
+
+NOTIFICATION_TIME_OPTIONS = (2, 12, 24)
+
+POPULAR_TIMEZONES = (
+    'Europe/Moscow', 'Europe/Kaliningrad',
+    'Asia/Yekaterinburg', 'Asia/Omsk',
+    'Asia/Vladivostok', 'Europe/Minsk',
+    'Asia/Almaty', 'Asia/Tashkent'
+)
+
+
+# Клавиатуры, зависящие от настроек, кэшируем по значениям, которые в них показаны:
+# после переключения настройки просто соберётся и запомнится другой вариант
+@lru_cache(maxsize=32)
+def lesson_minute_keyboard(hour):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{hour:02d}:{minute:02d}", callback_data=f"lesson_minute:{minute}")
+         for minute in (0, 15, 30, 45)],
+        [InlineKeyboardButton("❌ Отмена", callback_data="cancel")]
+    ])
+
+
+@lru_cache(maxsize=16)
+def lesson_date_keyboard(today):
+    """Ближайшие 7 дней начиная с today (дата в таймзоне ученика)"""
+    keyboard = []
+    for i in range(7):
+        date = today + timedelta(days=i)
+        date_str = date.strftime('%d.%m.%Y')
+        weekday = date.strftime('%A')
+        if i == 0:
+            display = f"{date_str} (сегодня)"
+        elif i == 1:
+            display = f"{date_str} (завтра)"
+        elif i == 2:
+            display = f"{date_str} (послезавтра)"
+        else:
+            display = f"{date_str} ({weekday})"
+        keyboard.append([InlineKeyboardButton(display, callback_data=f"lesson_date:{date_str}")])
+
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
     return InlineKeyboardMarkup(keyboard)
 
 
-def get_student_main_keyboard():
-    """Клавиатура ученика"""
-    keyboard = [
-        [
-            InlineKeyboardButton("✅ ДЗ", callback_data='student_hw_done'),
-            InlineKeyboardButton("📚 Мои ДЗ", callback_data='student_my_hw')
-        ],
-        [
-            InlineKeyboardButton("🗓 Расписание", callback_data='student_schedule'),
-            InlineKeyboardButton("👤 Профиль", callback_data='student_profile')
-        ],
-        [
-            InlineKeyboardButton("❓ Помощь", callback_data='help')
-        ]
-    ]
+@lru_cache(maxsize=8)
+def notifications_keyboard(homework_reminders, lesson_reminders, late_homework_alerts):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(
+            f"{'🔔' if homework_reminders else '🔕'} ДЗ",
+            callback_data="toggle_hw_reminders"
+        )],
+        [InlineKeyboardButton(
+            f"{'🔔' if lesson_reminders else '🔕'} Занятия",
+            callback_data="toggle_lesson_reminders"
+        )],
+        [InlineKeyboardButton(
+            f"{'🔔' if late_homework_alerts else '🔕'} Просрочки",
+            callback_data="toggle_late_alerts"
+        )],
+        [InlineKeyboardButton(
+            "⏰ Время ДЗ",
+            callback_data="hw_notification_times"
+        )],
+        [InlineKeyboardButton(
+            "⏰ Время занятий",
+            callback_data="lesson_notification_times"
+        )],
+        [InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")]
+    ])
+
+
+@lru_cache(maxsize=32)
+def notification_times_keyboard(callback_prefix, active_times):
+    keyboard = []
+    for time in NOTIFICATION_TIME_OPTIONS:
+        emoji = "✅" if time in active_times else "☑️"
+        keyboard.append([
+            InlineKeyboardButton(
+                f"{emoji} {time}ч",
+                callback_data=f"{callback_prefix}:{time}"
+            )
+        ])
+
+    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="settings_notifications")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+@lru_cache(maxsize=32)
+def lives_settings_keyboard(enabled, max_lives, penalty_late, penalty_lesson, reward_early,
+                            auto_reset_days, show_to_student):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(
+            f"{'❤️' if enabled else '💔'} Система",
+            callback_data="toggle_lives_system"
+        )],
+        [InlineKeyboardButton(
+            f"🔢 Макс: {max_lives}",
+            callback_data="set_max_lives"
+        )],
+        [InlineKeyboardButton(
+            f"➖ Просрочка: {penalty_late}",
+            callback_data="set_penalty_late"
+        )],
+        [InlineKeyboardButton(
+            f"➖ Занятие: {penalty_lesson}",
+            callback_data="set_penalty_lesson"
+        )],
+        [InlineKeyboardButton(
+            f"➕ Досрочно: {reward_early}",
+            callback_data="set_reward_early"
+        )],
+        [InlineKeyboardButton(
+            f"🔄 Сброс: {auto_reset_days}д",
+            callback_data="set_reset_days"
+        )],
+        [InlineKeyboardButton(
+            f"{'👁️' if show_to_student else '🙈'} Показ",
+            callback_data="toggle_show_lives"
+        )],
+        [InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")]
+    ])
+
+
+@lru_cache(maxsize=16)
+def timezone_keyboard(current_tz):
+    keyboard = []
+    for tz in POPULAR_TIMEZONES:
+        display_name = tz.split('/')[-1].replace('_', ' ')
+        if tz == current_tz:
+            keyboard.append([InlineKeyboardButton(f"✅ {display_name}", callback_data=f"timezone:{tz}")])
+        else:
+            keyboard.append([InlineKeyboardButton(f"{display_name}", callback_data=f"timezone:{tz}")])
+
+    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")])
     return InlineKeyboardMarkup(keyboard)
 
 
+# ====================== МАРШРУТЫ КНОПОК ======================
+# callback_data -> (обработчик, только для репетитора)
+CALLBACK_ROUTES = {
+    'tutor_list_hw': (tutor_list_hw_callback, True),
+    'tutor_list_students': (tutor_list_students_callback, True),
+    'tutor_stats': (tutor_stats_callback, True),
+    'clear_all_confirm': (clear_all_confirm, True),
+    'student_hw_done': (student_hw_done_callback, False),
+    'student_my_hw': (student_my_hw_callback, False),
+    'student_schedule': (student_schedule_callback, False),
+    'student_profile': (student_profile_callback, False),
+    'help': (help_command, False),
+    'back_to_main': (back_to_main, False),
+}
+
+
+async def route_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Единая точка входа для кнопок вне диалогов"""
+    handler, tutor_only = CALLBACK_ROUTES[update.callback_query.data]
+    if tutor_only and not is_tutor(update.effective_user.id):
+        await update.callback_query.answer("Доступно только репетитору!")
+        return
+    await handler(update, context)
+
+
 # ====================== ОСНОВНАЯ ФУНКЦИЯ ======================
-async def main_async():
-    global application, scheduler
+async def on_startup(app: Application):
+    """Запуск планировщика в event loop приложения"""
+    global scheduler
+
+    scheduler = AsyncIOScheduler(timezone=timezone(settings['timezone']))
+    scheduler.start()
+    schedule_reminders()
+    start_notification_worker()
+
+    logger.info("✅ Бот успешно запущен!")
+    logger.info("🕐 Текущее время: %s", get_local_time())
+    logger.info("👥 Зарегистрировано учеников: %s", len(get_students()))
+    logger.info("👉 Напишите боту /start в Telegram")
+
+
+async def on_stop(app: Application):
+    """Остановка очереди уведомлений, пока бот ещё может отправлять сообщения"""
+    await stop_notification_worker()
+
+
+async def on_shutdown(app: Application):
+    """Остановка планировщика"""
+    if scheduler and scheduler.running:
+        scheduler.shutdown()
+        logger.info("✅ Планировщик остановлен")
+
+
+def main():
+    global application
 
     logger.info("=" * 50)
     logger.info("🚀 ЗАПУСК HELPER TUTOR BOT")
@@ -2161,213 +2521,193 @@ async def main_async():
         logger.error("❌ TELEGRAM_BOT_TOKEN не установлен!")
         return
 
-    logger.info(f"✅ Токен: установлен")
-    logger.info(f"✅ Репетитор ID: {TUTOR_ID if TUTOR_ID else 'не установлен'}")
-    logger.info(f"✅ Таймзона: {settings['timezone']}")
-
-    try:
-        application = Application.builder().token(TOKEN).build()
-        application.add_error_handler(error_handler)
+    logger.info("✅ Токен: установлен")
+    logger.info("✅ Репетитор ID: %s", TUTOR_ID if TUTOR_ID else 'не установлен')
+    logger.info("✅ Таймзона: %s", settings['timezone'])
 
-        scheduler = AsyncIOScheduler(timezone=timezone(settings['timezone']))
-        scheduler.start()
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    elif uvloop:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        # Не больше 30 сообщений в секунду на весь бот — лимит Telegram
+        .rate_limiter(AIORateLimiter(overall_max_rate=30, overall_time_period=1))
+        # Пул соединений для запросов к Bot API: параллельные отправки не ждут друг друга.
+        # Таймауты чтения/записи больше стандартных 5 с, чтобы не обрывать медленные ответы
+        .connection_pool_size(256)
+        .connect_timeout(5)
+        .read_timeout(15)
+        .write_timeout(15)
+        # Обработчики запускаются отдельными задачами: медленная отправка одному
+        # пользователю не задерживает обработку обновлений от остальных.
+        # ConversationHandler сам дожидается таких задач перед сменой состояния
+        .defaults(Defaults(block=False))
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    application.add_error_handler(error_handler)
 
-        # Conversation Handler для ДЗ
-        conv_hw_handler = ConversationHandler(
-            entry_points=[
-                CallbackQueryHandler(tutor_add_hw_start, pattern='^tutor_add_hw$'),
+    # Conversation Handler для ДЗ
+    conv_hw_handler = ConversationHandler(
+        entry_points=[
+            CallbackQueryHandler(tutor_add_hw_start, pattern='^tutor_add_hw$'),
+            CallbackQueryHandler(tutor_select_student_hw, pattern='^hw_student:')
+        ],
+        states={
+            WAITING_HW_STUDENT: [
                 CallbackQueryHandler(tutor_select_student_hw, pattern='^hw_student:')
             ],
-            states={
-                WAITING_HW_STUDENT: [
-                    CallbackQueryHandler(tutor_select_student_hw, pattern='^hw_student:')
-                ],
-                WAITING_HW_TEXT: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, tutor_hw_text)
-                ],
-                WAITING_HW_DEADLINE: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, tutor_hw_deadline)
-                ],
-            },
-            fallbacks=[
-                CallbackQueryHandler(cancel, pattern='^cancel$'),
-                CommandHandler('cancel', cancel)
+            WAITING_HW_TEXT: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, tutor_hw_text)
             ],
-            allow_reentry=True  # Разрешаем повторный вход
-        )
+            WAITING_HW_DEADLINE: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, tutor_hw_deadline)
+            ],
+        },
+        fallbacks=[
+            CallbackQueryHandler(cancel, pattern='^cancel$'),
+            CommandHandler('cancel', cancel)
+        ],
+        allow_reentry=True  # Разрешаем повторный вход
+    )
 
-        # Conversation Handler для занятий
-        conv_lesson_handler = ConversationHandler(
-            entry_points=[
-                CallbackQueryHandler(tutor_add_lesson_start, pattern='^tutor_add_lesson$'),
+    # Conversation Handler для занятий
+    conv_lesson_handler = ConversationHandler(
+        entry_points=[
+            CallbackQueryHandler(tutor_add_lesson_start, pattern='^tutor_add_lesson$'),
+            CallbackQueryHandler(tutor_select_student_lesson, pattern='^lesson_student:')
+        ],
+        states={
+            WAITING_LESSON_STUDENT: [
                 CallbackQueryHandler(tutor_select_student_lesson, pattern='^lesson_student:')
             ],
-            states={
-                WAITING_LESSON_STUDENT: [
-                    CallbackQueryHandler(tutor_select_student_lesson, pattern='^lesson_student:')
-                ],
-                WAITING_LESSON_TOPIC: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, tutor_lesson_topic)
-                ],
-                WAITING_LESSON_DATE: [
-                    CallbackQueryHandler(tutor_lesson_date, pattern='^lesson_date:')
-                ],
-                WAITING_LESSON_HOUR: [
-                    CallbackQueryHandler(tutor_lesson_hour, pattern='^lesson_hour:')
-                ],
-                WAITING_LESSON_MINUTE: [
-                    CallbackQueryHandler(tutor_lesson_minute, pattern='^lesson_minute:')
-                ],
-            },
-            fallbacks=[
-                CallbackQueryHandler(cancel, pattern='^cancel$'),
-                CommandHandler('cancel', cancel)
+            WAITING_LESSON_TOPIC: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, tutor_lesson_topic)
             ],
-            allow_reentry=True
-        )
-
-        # Conversation Handler для удаления учеников
-        conv_delete_student = ConversationHandler(
-            entry_points=[
-                CallbackQueryHandler(tutor_delete_student_start, pattern='^tutor_delete_student$'),
-                CallbackQueryHandler(tutor_delete_student_confirm, pattern='^delete_student:')
+            WAITING_LESSON_DATE: [
+                CallbackQueryHandler(tutor_lesson_date, pattern='^lesson_date:')
             ],
-            states={},
-            fallbacks=[
-                CallbackQueryHandler(tutor_delete_student_execute, pattern='^confirm_delete:'),
-                CallbackQueryHandler(cancel, pattern='^cancel$')
+            WAITING_LESSON_HOUR: [
+                CallbackQueryHandler(tutor_lesson_hour, pattern='^lesson_hour:')
             ],
-            allow_reentry=True
-        )
+            WAITING_LESSON_MINUTE: [
+                CallbackQueryHandler(tutor_lesson_minute, pattern='^lesson_minute:')
+            ],
+        },
+        fallbacks=[
+            CallbackQueryHandler(cancel, pattern='^cancel$'),
+            CommandHandler('cancel', cancel)
+        ],
+        allow_reentry=True
+    )
+
+    # Conversation Handler для удаления учеников
+    conv_delete_student = ConversationHandler(
+        entry_points=[
+            CallbackQueryHandler(tutor_delete_student_start, pattern='^tutor_delete_student$'),
+            CallbackQueryHandler(tutor_delete_student_confirm, pattern='^delete_student:')
+        ],
+        states={},
+        fallbacks=[
+            CallbackQueryHandler(tutor_delete_student_execute, pattern='^confirm_delete:'),
+            CallbackQueryHandler(cancel, pattern='^cancel$')
+        ],
+        allow_reentry=True
+    )
 
-        # Conversation Handler для настроек
-        conv_settings = ConversationHandler(
-            entry_points=[
-                CallbackQueryHandler(tutor_settings_start_callback, pattern='^tutor_settings$'),
+    # Conversation Handler для настроек
+    conv_settings = ConversationHandler(
+        entry_points=[
+            CallbackQueryHandler(tutor_settings_start_callback, pattern='^tutor_settings$'),
+            CallbackQueryHandler(tutor_settings_notifications, pattern='^settings_notifications$'),
+            CallbackQueryHandler(tutor_settings_lives, pattern='^settings_lives$'),
+            CallbackQueryHandler(tutor_settings_time, pattern='^settings_time$')
+        ],
+        states={
+            WAITING_SETTINGS_CHOICE: [
                 CallbackQueryHandler(tutor_settings_notifications, pattern='^settings_notifications$'),
                 CallbackQueryHandler(tutor_settings_lives, pattern='^settings_lives$'),
-                CallbackQueryHandler(tutor_settings_time, pattern='^settings_time$')
+                CallbackQueryHandler(tutor_settings_time, pattern='^settings_time$'),
+                CallbackQueryHandler(back_to_main, pattern='^cancel$'),
+                CallbackQueryHandler(tutor_stats_callback, pattern='^settings_stats$'),
             ],
-            states={
-                WAITING_SETTINGS_CHOICE: [
-                    CallbackQueryHandler(tutor_settings_notifications, pattern='^settings_notifications$'),
-                    CallbackQueryHandler(tutor_settings_lives, pattern='^settings_lives$'),
-                    CallbackQueryHandler(tutor_settings_time, pattern='^settings_time$'),
-                    CallbackQueryHandler(back_to_main, pattern='^cancel$'),
-                    CallbackQueryHandler(tutor_stats_callback, pattern='^settings_stats$'),
-                ],
-                WAITING_NOTIFICATION_SETTINGS: [
-                    CallbackQueryHandler(toggle_notification_setting,
-                                         pattern='^toggle_(hw_reminders|lesson_reminders|late_alerts)$'),
-                    CallbackQueryHandler(hw_notification_times, pattern='^hw_notification_times$'),
-                    CallbackQueryHandler(lesson_notification_times, pattern='^lesson_notification_times$'),
-                    CallbackQueryHandler(toggle_notification_time, pattern='^toggle_(hw|lesson)_time:'),
-                    CallbackQueryHandler(settings_back, pattern='^settings_back$'),
-                ],
-                WAITING_LIVES_SETTINGS: [
-                    CallbackQueryHandler(toggle_lives_setting, pattern='^toggle_(lives_system|show_lives)$'),
-                    CallbackQueryHandler(set_lives_value_start,
-                                         pattern='^set_(max_lives|penalty_late|penalty_lesson|reward_early|reset_days)$'),
-                    CallbackQueryHandler(settings_back, pattern='^settings_back$'),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, set_lives_value_save),
-                ],
-                WAITING_TIMEZONE_SETTINGS: [
-                    CallbackQueryHandler(set_timezone, pattern='^timezone:'),
-                    CallbackQueryHandler(settings_back, pattern='^settings_back$'),
-                ],
-            },
-            fallbacks=[
-                CallbackQueryHandler(cancel, pattern='^cancel$'),
-                CommandHandler('cancel', cancel)
+            WAITING_NOTIFICATION_SETTINGS: [
+                CallbackQueryHandler(toggle_notification_setting,
+                                     pattern='^toggle_(hw_reminders|lesson_reminders|late_alerts)$'),
+                CallbackQueryHandler(hw_notification_times, pattern='^hw_notification_times$'),
+                CallbackQueryHandler(lesson_notification_times, pattern='^lesson_notification_times$'),
+                CallbackQueryHandler(toggle_notification_time, pattern='^toggle_(hw|lesson)_time:'),
+                CallbackQueryHandler(settings_back, pattern='^settings_back$'),
             ],
-            allow_reentry=True
-        )
-
-        # Команды репетитора
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("menu", menu))
-        application.add_handler(CommandHandler("add_hw", add_hw_command))
-        application.add_handler(CommandHandler("add_lesson", add_lesson_command))
-        application.add_handler(CommandHandler("list_hw", list_hw_command))
-        application.add_handler(CommandHandler("students", list_students_command))
-        application.add_handler(CommandHandler("delete_student", delete_student_command))
-        application.add_handler(CommandHandler("settings", settings_command))
-        application.add_handler(CommandHandler("stats", stats_command))
-        application.add_handler(CommandHandler("reset_lives", reset_lives_command))
-        application.add_handler(CommandHandler("clear_all", clear_all_command))
-        application.add_handler(CommandHandler("help", help_command))
-
-        # Кнопки репетитора
-        application.add_handler(CallbackQueryHandler(tutor_list_hw_callback, pattern='^tutor_list_hw$'))
-        application.add_handler(CallbackQueryHandler(tutor_list_students_callback, pattern='^tutor_list_students$'))
-        application.add_handler(CallbackQueryHandler(tutor_stats_callback, pattern='^tutor_stats$'))
-
-        # Кнопки ученика
-        application.add_handler(CallbackQueryHandler(student_hw_done_callback, pattern='^student_hw_done$'))
-        application.add_handler(CallbackQueryHandler(complete_homework, pattern='^complete_hw:'))
-        application.add_handler(CallbackQueryHandler(student_my_hw_callback, pattern='^student_my_hw$'))
-        application.add_handler(CallbackQueryHandler(student_schedule_callback, pattern='^student_schedule$'))
-        application.add_handler(CallbackQueryHandler(student_profile_callback, pattern='^student_profile$'))
-
-        # Общие кнопки
-        application.add_handler(CallbackQueryHandler(help_command, pattern='^help$'))
-        application.add_handler(CallbackQueryHandler(clear_all_confirm, pattern='^clear_all_confirm$'))
-        application.add_handler(CallbackQueryHandler(back_to_main, pattern='^back_to_main$'))
-
-        # Conversation handlers
-        application.add_handler(conv_hw_handler)
-        application.add_handler(conv_lesson_handler)
-        application.add_handler(conv_delete_student)
-        application.add_handler(conv_settings)
-
-        logger.info("✅ Обработчики зарегистрированы")
-
-        schedule_reminders()
-
-        logger.info("🤖 Бот запускается...")
-
-        await application.initialize()
-        await application.start()
-        await application.updater.start_polling()
-
-        logger.info("✅ Бот успешно запущен!")
-        logger.info(f"🕐 Текущее время: {get_local_time()}")
-        logger.info(f"👥 Зарегистрировано учеников: {len(get_students())}")
-        logger.info("👉 Напишите боту /start в Telegram")
-
-        while True:
-            await asyncio.sleep(3600)
-
-    except asyncio.CancelledError:
-        logger.info("🛑 Получен сигнал отмены")
-    except Exception as e:
-        logger.error(f"❌ Критическая ошибка: {e}", exc_info=True)
-    finally:
-        if application:
-            try:
-                await application.updater.stop()
-                await application.stop()
-                await application.shutdown()
-                logger.info("✅ Бот остановлен")
-            except:
-                pass
-
-        if scheduler and scheduler.running:
-            scheduler.shutdown()
-            logger.info("✅ Планировщик остановлен")
-
+            WAITING_LIVES_SETTINGS: [
+                CallbackQueryHandler(toggle_lives_setting, pattern='^toggle_(lives_system|show_lives)$'),
+                CallbackQueryHandler(set_lives_value_start,
+                                     pattern='^set_(max_lives|penalty_late|penalty_lesson|reward_early|reset_days)$'),
+                CallbackQueryHandler(settings_back, pattern='^settings_back$'),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, set_lives_value_save),
+            ],
+            WAITING_TIMEZONE_SETTINGS: [
+                CallbackQueryHandler(set_timezone, pattern='^timezone:'),
+                CallbackQueryHandler(settings_back, pattern='^settings_back$'),
+            ],
+        },
+        fallbacks=[
+            CallbackQueryHandler(cancel, pattern='^cancel$'),
+            CommandHandler('cancel', cancel)
+        ],
+        allow_reentry=True
+    )
 
-def main():
-    if sys.platform == 'win32':
-        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    # Команды репетитора
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("menu", menu))
+    application.add_handler(CommandHandler("add_hw", add_hw_command))
+    application.add_handler(CommandHandler("add_lesson", add_lesson_command))
+    application.add_handler(CommandHandler("list_hw", list_hw_command))
+    application.add_handler(CommandHandler("students", list_students_command))
+    application.add_handler(CommandHandler("delete_student", delete_student_command))
+    application.add_handler(CommandHandler("settings", settings_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("reset_lives", reset_lives_command))
+    application.add_handler(CommandHandler("clear_all", clear_all_command))
+    application.add_handler(CommandHandler("help", help_command))
+
+    # Кнопки вне диалогов: один обработчик с таблицей маршрутов
+    application.add_handler(CallbackQueryHandler(route_callback, pattern=CALLBACK_ROUTES.__contains__))
+    application.add_handler(CallbackQueryHandler(complete_homework, pattern='^complete_hw:'))
+
+    # Conversation handlers
+    application.add_handler(conv_hw_handler)
+    application.add_handler(conv_lesson_handler)
+    application.add_handler(conv_delete_student)
+    application.add_handler(conv_settings)
+
+    logger.info("✅ Обработчики зарегистрированы")
+
+    logger.info("🤖 Бот запускается...")
 
     try:
-        asyncio.run(main_async())
-    except KeyboardInterrupt:
+        # run_polling/run_webhook сами управляют event loop и корректно завершают работу по SIGINT/SIGTERM
+        if WEBHOOK_URL:
+            logger.info("🌐 Режим вебхука: %s (порт %s)", WEBHOOK_URL, PORT)
+            application.run_webhook(
+                listen='0.0.0.0',
+                port=PORT,
+                url_path='telegram',
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/telegram",
+                secret_token=WEBHOOK_SECRET
+            )
+        else:
+            application.run_polling()
         logger.info("👋 Бот завершен")
     except Exception as e:
-        logger.error(f"❌ Фатальная ошибка: {e}")
+        logger.error("❌ Фатальная ошибка: %s", e, exc_info=True)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()